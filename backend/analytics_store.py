@@ -0,0 +1,436 @@
+"""Analytics event storage: raw time-series events, daily summaries and archival.
+
+Raw events go to a MongoDB time-series collection that expires them after
+ANALYTICS_RETENTION_DAYS. Every completed day is compacted into a single
+summary document before that happens, so historical totals survive expiry.
+Unique visitors are tracked separately, one document per visitor id with the
+time it was first seen, so they can be counted across all history without
+keeping per-day id lists. Summaries' unique_visitors is distinct per day only.
+
+Maintenance commands (run from the backend directory):
+
+    python -m analytics_store compact
+    python -m analytics_store archive --older-than-days 30 --out-dir ./analytics-archive
+    python -m analytics_store migrate-legacy
+    python -m analytics_store backfill-visitors
+"""
+import argparse
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta, date
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+RAW_COLLECTION = "analytics_events"
+DAILY_COLLECTION = "analytics_daily"
+VISITORS_COLLECTION = "analytics_visitors"
+LEGACY_COLLECTION = "analytics"
+
+ANALYTICS_RETENTION_DAYS = int(os.environ.get('ANALYTICS_RETENTION_DAYS', '90'))
+ANALYTICS_COMPACTION_INTERVAL_SECONDS = int(os.environ.get('ANALYTICS_COMPACTION_INTERVAL_SECONDS', '3600'))
+
+logger = logging.getLogger(__name__)
+
+
+def _day_start(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+
+
+MOBILE_USER_AGENT_RE = re.compile(r"Mobile|Android|iPhone", re.IGNORECASE)
+
+
+def device_type_from_user_agent(user_agent: Optional[str]) -> Optional[str]:
+    """Same classification the frontend sends with its own events"""
+    if not user_agent:
+        return None
+    return "mobile" if MOBILE_USER_AGENT_RE.search(user_agent) else "desktop"
+
+
+def build_event(event_type: str, page: Optional[str], device_type: Optional[str],
+                user_agent: Optional[str], visitor_id: str,
+                timestamp: Optional[datetime] = None) -> dict:
+    """Build a raw event document in the time-series layout"""
+    return {
+        "timestamp": timestamp or datetime.now(timezone.utc),
+        "meta": {"event_type": event_type, "device_type": device_type},
+        "page": page,
+        "user_agent": user_agent,
+        "visitor_id": visitor_id,
+    }
+
+
+async def ensure_collections(db, retention_days: int = ANALYTICS_RETENTION_DAYS):
+    """Create the time-series collection (or update its TTL) and summary indexes"""
+    expire_after = retention_days * 24 * 60 * 60
+    existing = await db.list_collection_names(filter={"name": RAW_COLLECTION})
+    if existing:
+        await db.command("collMod", RAW_COLLECTION, expireAfterSeconds=expire_after)
+    else:
+        await db.create_collection(
+            RAW_COLLECTION,
+            timeseries={"timeField": "timestamp", "metaField": "meta", "granularity": "minutes"},
+            expireAfterSeconds=expire_after,
+        )
+    await db[DAILY_COLLECTION].create_index("day", unique=True)
+    await db[VISITORS_COLLECTION].create_index("visitor_id", unique=True)
+
+
+async def record_event(db, doc: dict):
+    await db[RAW_COLLECTION].insert_one(doc)
+    if doc.get("visitor_id"):
+        await record_visitors(db, {doc["visitor_id"]: doc["timestamp"]})
+
+
+async def record_visitors(db, first_seen: Dict[str, datetime]):
+    """Upsert visitors, keeping the earliest time each was seen"""
+    if first_seen:
+        await db[VISITORS_COLLECTION].bulk_write([
+            UpdateOne({"visitor_id": visitor_id}, {"$min": {"first_seen": seen}}, upsert=True)
+            for visitor_id, seen in first_seen.items()
+        ], ordered=False)
+
+
+async def count_unique_visitors(db) -> int:
+    return await db[VISITORS_COLLECTION].count_documents({})
+
+
+async def backfill_visitors(db) -> int:
+    """Record visitors from raw events stored before visitors were tracked"""
+    first_seen = {}
+    async for row in db[RAW_COLLECTION].aggregate([
+        {"$match": {"visitor_id": {"$nin": [None, ""]}}},
+        {"$group": {"_id": "$visitor_id", "first_seen": {"$min": "$timestamp"}}},
+    ], allowDiskUse=True):
+        first_seen[row["_id"]] = row["first_seen"]
+        if len(first_seen) >= 1000:
+            await record_visitors(db, first_seen)
+            first_seen = {}
+    await record_visitors(db, first_seen)
+    return await count_unique_visitors(db)
+
+
+async def summarize_raw(db, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Dict[str, dict]:
+    """Aggregate raw events into per-day summaries, keyed by ISO day string"""
+    match = {}
+    if start or end:
+        match["timestamp"] = {}
+        if start:
+            match["timestamp"]["$gte"] = start
+        if end:
+            match["timestamp"]["$lt"] = end
+    day_expr = {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}}
+
+    counts = db[RAW_COLLECTION].aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "day": day_expr,
+                "event_type": "$meta.event_type",
+                "device_type": "$meta.device_type",
+                "page": "$page",
+            },
+            "count": {"$sum": 1},
+        }},
+    ])
+    visitors = db[RAW_COLLECTION].aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"day": day_expr, "visitor_id": "$visitor_id"}}},
+        {"$group": {"_id": "$_id.day", "unique_visitors": {"$sum": 1}}},
+    ])
+
+    days = defaultdict(lambda: {"counts": [], "unique_visitors": 0})
+    async for row in counts:
+        key = row["_id"]
+        days[key["day"]]["counts"].append({
+            "event_type": key.get("event_type"),
+            "device_type": key.get("device_type"),
+            "page": key.get("page"),
+            "count": row["count"],
+        })
+    async for row in visitors:
+        days[row["_id"]]["unique_visitors"] = row["unique_visitors"]
+
+    return {day: {"day": day, **summary} for day, summary in days.items()}
+
+
+async def last_compacted_day(db) -> Optional[date]:
+    latest = await db[DAILY_COLLECTION].find_one({}, {"_id": 0, "day": 1}, sort=[("day", -1)])
+    if latest is None:
+        return None
+    return date.fromisoformat(latest["day"])
+
+
+async def compact_daily_summaries(db, until: Optional[date] = None) -> int:
+    """Write summaries for every completed day not yet compacted.
+
+    Days are compacted up to (but excluding) `until`, which defaults to today
+    in UTC. Upserts make this safe to run concurrently or repeatedly.
+    """
+    until = until or datetime.now(timezone.utc).date()
+    last = await last_compacted_day(db)
+    if last is not None:
+        start_day = last + timedelta(days=1)
+    else:
+        oldest = await db[RAW_COLLECTION].find_one({}, {"_id": 0, "timestamp": 1}, sort=[("timestamp", 1)])
+        if oldest is None:
+            return 0
+        start_day = oldest["timestamp"].date()
+    if start_day >= until:
+        return 0
+
+    summaries = await summarize_raw(db, _day_start(start_day), _day_start(until))
+    now = datetime.now(timezone.utc)
+    for summary in summaries.values():
+        await db[DAILY_COLLECTION].update_one(
+            {"day": summary["day"]},
+            {"$set": {**summary, "compacted_at": now}},
+            upsert=True,
+        )
+    # Record empty days as well so the next run starts after `until`
+    day = start_day
+    while day < until:
+        await db[DAILY_COLLECTION].update_one(
+            {"day": day.isoformat()},
+            {"$setOnInsert": {"counts": [], "unique_visitors": 0, "compacted_at": now}},
+            upsert=True,
+        )
+        day += timedelta(days=1)
+    return len(summaries)
+
+
+async def load_daily_summaries(db) -> List[dict]:
+    """Return per-day summaries covering all history: compacted days plus live raw data"""
+    summaries = await db[DAILY_COLLECTION].find({}, {"_id": 0}).to_list(None)
+    last = await last_compacted_day(db)
+    start = _day_start(last + timedelta(days=1)) if last else None
+    raw = await summarize_raw(db, start=start)
+    return summaries + list(raw.values())
+
+
+def summarize_events(events) -> Dict[str, dict]:
+    """Pure-Python equivalent of `summarize_raw` for events already in memory"""
+    counts = defaultdict(lambda: defaultdict(int))
+    visitors = defaultdict(set)
+    for event in events:
+        day = event["timestamp"].date().isoformat()
+        meta = event.get("meta") or {}
+        counts[day][(meta.get("event_type"), meta.get("device_type"), event.get("page"))] += 1
+        visitors[day].add(event.get("visitor_id"))
+
+    return {
+        day: {
+            "day": day,
+            "counts": [
+                {"event_type": event_type, "device_type": device_type, "page": page, "count": count}
+                for (event_type, device_type, page), count in day_counts.items()
+            ],
+            "unique_visitors": len(visitors[day]),
+        }
+        for day, day_counts in counts.items()
+    }
+
+
+async def run_compaction_loop(analytics, interval_seconds: int = ANALYTICS_COMPACTION_INTERVAL_SECONDS):
+    """Background task: compact completed days periodically via an AnalyticsRepository"""
+    while True:
+        try:
+            compacted = await analytics.compact()
+            if compacted:
+                logger.info("Compacted %d day(s) of analytics events", compacted)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Analytics compaction failed")
+        await asyncio.sleep(interval_seconds)
+
+
+ARCHIVE_NAME_PREFIX = "analytics-"
+ARCHIVE_NAME_SUFFIX = ".ndjson.gz"
+
+
+def _archive_path(out_dir: Path, day: date) -> Path:
+    return out_dir / f"{ARCHIVE_NAME_PREFIX}{day.isoformat()}{ARCHIVE_NAME_SUFFIX}"
+
+
+def last_archived_day(out_dir: Path) -> Optional[date]:
+    days = []
+    for path in out_dir.glob(f"{ARCHIVE_NAME_PREFIX}*{ARCHIVE_NAME_SUFFIX}"):
+        try:
+            days.append(date.fromisoformat(path.name[len(ARCHIVE_NAME_PREFIX):-len(ARCHIVE_NAME_SUFFIX)]))
+        except ValueError:
+            continue
+    return max(days) if days else None
+
+
+async def write_daily_archives(events, out_dir: Path) -> int:
+    """Write time-ordered events to one gzipped NDJSON file per day not yet archived"""
+    # Never rewrite an existing archive: once the TTL has expired part of a day,
+    # re-exporting it would replace the file with fewer events. Files are
+    # renamed into place when complete so an interrupted run leaves no partial day.
+    written = 0
+    current_day = None
+    handle = None
+    tmp_path = None
+    try:
+        async for event in events:
+            event_day = event["timestamp"].date()
+            if event_day != current_day:
+                if handle:
+                    handle.close()
+                    os.replace(tmp_path, _archive_path(out_dir, current_day))
+                    handle = None
+                current_day = event_day
+                if not _archive_path(out_dir, event_day).exists():
+                    tmp_path = _archive_path(out_dir, event_day).with_suffix(".tmp")
+                    handle = gzip.open(tmp_path, "wt", encoding="utf-8")
+            if handle is None:
+                continue
+            event["timestamp"] = event["timestamp"].replace(tzinfo=timezone.utc).isoformat()
+            handle.write(json.dumps(event, separators=(",", ":")) + "\n")
+            written += 1
+        if handle:
+            handle.close()
+            os.replace(tmp_path, _archive_path(out_dir, current_day))
+            handle = None
+    finally:
+        if handle:
+            handle.close()
+            tmp_path.unlink(missing_ok=True)
+    return written
+
+
+async def archive_raw_events(db, before: date, out_dir: Path) -> int:
+    """Archive raw events older than `before` for days not archived yet"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    window = {"$lt": _day_start(before)}
+    last = last_archived_day(out_dir)
+    if last:
+        window["$gte"] = _day_start(last + timedelta(days=1))
+    cursor = db[RAW_COLLECTION].find({"timestamp": window}, {"_id": 0}).sort("timestamp", 1)
+    return await write_daily_archives(cursor, out_dir)
+
+
+def merge_summaries(existing: dict, extra: dict) -> dict:
+    """Add `extra`'s counts into `existing` (same day)"""
+    counts = defaultdict(int)
+    for row in existing.get("counts", []) + extra.get("counts", []):
+        counts[(row.get("event_type"), row.get("device_type"), row.get("page"))] += row["count"]
+    return {
+        "day": existing["day"],
+        "counts": [
+            {"event_type": event_type, "device_type": device_type, "page": page, "count": count}
+            for (event_type, device_type, page), count in counts.items()
+        ],
+        # Visitor ids are not kept per day, so a day with both kinds of events
+        # can count someone twice
+        "unique_visitors": existing.get("unique_visitors", 0) + extra.get("unique_visitors", 0),
+    }
+
+
+def _legacy_timestamp(value) -> Optional[datetime]:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value if isinstance(value, datetime) else None
+
+
+async def migrate_legacy_events(db, today: Optional[date] = None) -> int:
+    """Fold the old `analytics` collection into daily summaries and visitors
+
+    Legacy events are summarized straight into analytics_daily rather than
+    copied into the raw collection, where the TTL would delete old ones
+    before they are compacted. Each day is marked when merged, so reruns
+    skip it. Events from today are left for a later run, since writing
+    today's summary would stop compaction picking up today's raw events.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    # Compact first so every completed day with raw events has a summary to merge into
+    await compact_daily_summaries(db, today)
+
+    events = []
+    async for old in db[LEGACY_COLLECTION].find({}, {"_id": 0}):
+        timestamp = _legacy_timestamp(old.get("timestamp"))
+        if timestamp is None:
+            continue
+        events.append(build_event(
+            old.get("event_type"), old.get("page"), old.get("device_type"),
+            old.get("user_agent"), old.get("visitor_id"), timestamp,
+        ))
+
+    first_seen = {}
+    for event in events:
+        visitor_id = event["visitor_id"]
+        if visitor_id and (visitor_id not in first_seen or event["timestamp"] < first_seen[visitor_id]):
+            first_seen[visitor_id] = event["timestamp"]
+    await record_visitors(db, first_seen)
+
+    completed = [e for e in events if e["timestamp"].date() < today]
+    migrated = 0
+    now = datetime.now(timezone.utc)
+    for day, summary in sorted(summarize_events(completed).items()):
+        existing = await db[DAILY_COLLECTION].find_one({"day": day}, {"_id": 0})
+        if existing and existing.get("legacy_migrated"):
+            continue
+        merged = merge_summaries(existing, summary) if existing else summary
+        try:
+            await db[DAILY_COLLECTION].update_one(
+                {"day": day, "legacy_migrated": {"$ne": True}},
+                {"$set": {**merged, "legacy_migrated": True, "compacted_at": now}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            # Another run merged this day in the meantime
+            continue
+        migrated += sum(row["count"] for row in summary["counts"])
+    return migrated
+
+
+async def _main(args):
+    from dotenv import load_dotenv
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    load_dotenv(Path(__file__).parent / '.env')
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        await ensure_collections(db)
+        if args.command == "compact":
+            count = await compact_daily_summaries(db)
+            print(f"Compacted {count} day(s)")
+        elif args.command == "archive":
+            before = datetime.now(timezone.utc).date() - timedelta(days=args.older_than_days)
+            count = await archive_raw_events(db, before, Path(args.out_dir))
+            print(f"Archived {count} new event(s) older than {before.isoformat()} to {args.out_dir}")
+        elif args.command == "migrate-legacy":
+            count = await migrate_legacy_events(db)
+            print(f"Merged {count} legacy event(s) into daily summaries (rerun tomorrow for any from today)")
+        elif args.command == "backfill-visitors":
+            count = await backfill_visitors(db)
+            print(f"{count} unique visitor(s) recorded")
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carplog-Pro analytics maintenance")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("compact", help="Summarize completed days into analytics_daily")
+    archive = sub.add_parser("archive", help="Export old raw events to gzipped NDJSON files")
+    archive.add_argument("--older-than-days", type=int, default=30)
+    archive.add_argument("--out-dir", default="analytics-archive")
+    sub.add_parser("migrate-legacy", help="Summarize the old analytics collection into analytics_daily")
+    sub.add_parser("backfill-visitors", help="Record unique visitors from stored raw events")
+    asyncio.run(_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
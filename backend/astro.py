@@ -0,0 +1,127 @@
+"""Offline astronomical context for catches: moon phase and sunrise/sunset.
+
+Everything is computed locally from the date (and optional venue coordinates)
+with low-precision formulas from Meeus, "Astronomical Algorithms", accurate to
+a minute or two for sun times and well within a phase bucket for the moon.
+
+Results are memoized per day (and per 0.1 degree of latitude/longitude for sun
+times), so bulk imports and backfills only pay for each distinct day once.
+"""
+import math
+from datetime import datetime, timezone, timedelta, date
+from functools import lru_cache
+from typing import Optional
+
+SYNODIC_MONTH_DAYS = 29.530588853
+J2000 = 2451545.0
+UNIX_EPOCH_JD = 2440587.5
+
+# Sun's centre 0.833 degrees below the horizon: refraction plus solar radius
+SUNRISE_ALTITUDE_DEG = -0.833
+COORDINATE_PRECISION = 1  # decimal places of lat/lon used as cache key
+
+MOON_PHASES = [
+    "New Moon", "Waxing Crescent", "First Quarter", "Waxing Gibbous",
+    "Full Moon", "Waning Gibbous", "Last Quarter", "Waning Crescent",
+]
+
+
+def _julian_day(moment: datetime) -> float:
+    return moment.timestamp() / 86400.0 + UNIX_EPOCH_JD
+
+
+def _from_julian_day(jd: float) -> datetime:
+    return datetime.fromtimestamp((jd - UNIX_EPOCH_JD) * 86400.0, tz=timezone.utc).replace(microsecond=0)
+
+
+def _noon_utc(day: date) -> datetime:
+    return datetime(day.year, day.month, day.day, 12, tzinfo=timezone.utc)
+
+
+@lru_cache(maxsize=4096)
+def moon_for_day(day: date) -> dict:
+    """Moon phase, illumination and age at noon UTC on `day`"""
+    t = (_julian_day(_noon_utc(day)) - J2000) / 36525.0
+    # Mean elongation of the moon, sun's and moon's mean anomalies (Meeus 47)
+    d = math.radians((297.8501921 + 445267.1114034 * t) % 360)
+    m = math.radians((357.5291092 + 35999.0502909 * t) % 360)
+    mp = math.radians((134.9633964 + 477198.8675055 * t) % 360)
+
+    # Phase angle (Meeus 48.4)
+    phase_angle = math.radians(180 - math.degrees(d)
+                               - 6.289 * math.sin(mp)
+                               + 2.100 * math.sin(m)
+                               - 1.274 * math.sin(2 * d - mp)
+                               - 0.658 * math.sin(2 * d)
+                               - 0.214 * math.sin(2 * mp)
+                               - 0.110 * math.sin(d))
+    illumination = (1 + math.cos(phase_angle)) / 2
+
+    # Elongation 0..360 measured from new moon gives the age in the cycle
+    elongation = (180 - math.degrees(phase_angle)) % 360
+    age_days = elongation / 360 * SYNODIC_MONTH_DAYS
+    phase_index = int((elongation + 22.5) // 45) % 8
+
+    return {
+        "moon_phase": MOON_PHASES[phase_index],
+        "moon_illumination": round(illumination, 3),
+        "moon_age_days": round(age_days, 2),
+    }
+
+
+@lru_cache(maxsize=16384)
+def sun_for_day(day: date, latitude: float, longitude: float) -> dict:
+    """Sunrise and sunset (UTC) for `day` at a location; None during polar day/night"""
+    # Sunrise equation: days since J2000 at local mean solar noon
+    n = (day - date(2000, 1, 1)).days
+    j_star = n - longitude / 360.0
+    m = math.radians((357.5291 + 0.98560028 * j_star) % 360)
+    center = 1.9148 * math.sin(m) + 0.0200 * math.sin(2 * m) + 0.0003 * math.sin(3 * m)
+    ecliptic_longitude = math.radians((math.degrees(m) + center + 180 + 102.9372) % 360)
+    transit = J2000 + j_star + 0.0053 * math.sin(m) - 0.0069 * math.sin(2 * ecliptic_longitude)
+
+    sin_declination = math.sin(ecliptic_longitude) * math.sin(math.radians(23.4397))
+    cos_declination = math.cos(math.asin(sin_declination))
+    lat = math.radians(latitude)
+    cos_hour_angle = ((math.sin(math.radians(SUNRISE_ALTITUDE_DEG)) - math.sin(lat) * sin_declination)
+                      / (math.cos(lat) * cos_declination))
+    if not -1.0 <= cos_hour_angle <= 1.0:
+        return {"sunrise": None, "sunset": None}
+
+    hour_angle_days = math.degrees(math.acos(cos_hour_angle)) / 360.0
+    return {
+        "sunrise": _from_julian_day(transit - hour_angle_days),
+        "sunset": _from_julian_day(transit + hour_angle_days),
+    }
+
+
+def environment_for(caught_at: datetime, latitude: Optional[float] = None,
+                    longitude: Optional[float] = None) -> dict:
+    """Astronomical context for a catch; sun fields need venue coordinates"""
+    if caught_at.tzinfo is None:
+        caught_at = caught_at.replace(tzinfo=timezone.utc)
+    # Normalise first so the result doesn't depend on the offset the client sent
+    caught_at = caught_at.astimezone(timezone.utc)
+
+    env = dict(moon_for_day(caught_at.date()))
+    env.update(sunrise=None, sunset=None, minutes_from_sunrise=None, minutes_from_sunset=None)
+    if latitude is None or longitude is None:
+        return env
+
+    # Use the local solar date so far-east/west venues get their own day's sun
+    local_day = (caught_at + timedelta(hours=longitude / 15.0)).date()
+    sun = sun_for_day(local_day, round(latitude, COORDINATE_PRECISION), round(longitude, COORDINATE_PRECISION))
+    env.update(sun)
+    if sun["sunrise"] is not None:
+        env["minutes_from_sunrise"] = round((caught_at - sun["sunrise"]).total_seconds() / 60)
+        env["minutes_from_sunset"] = round((caught_at - sun["sunset"]).total_seconds() / 60)
+    return env
+
+
+def environment_document(env: dict) -> dict:
+    """Environment dict in storage form (ISO strings, like caught_at)"""
+    doc = dict(env)
+    for key in ("sunrise", "sunset"):
+        if isinstance(doc.get(key), datetime):
+            doc[key] = doc[key].isoformat()
+    return doc
@@ -0,0 +1,91 @@
+"""CPU-only benchmark of the API on the in-memory storage backend.
+
+Runs the app in-process (no MongoDB, no network), seeds one user with
+random catches and times the read endpoints:
+
+    python -m benchmark --catches 2000 --requests 200
+
+Stats caching and the job worker are disabled so each request does the
+full computation.
+"""
+
+import argparse
+import logging
+import os
+import random
+import statistics
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Dict, List
+
+ENDPOINTS = [
+    ("catches", "/api/catches", {"limit": 100}),
+    ("stats/monthly", "/api/stats/monthly", {"year": 2024}),
+    ("stats/yearly", "/api/stats/yearly", {}),
+]
+
+
+def random_catches(count: int, seed: int) -> List[dict]:
+    rng = random.Random(seed)
+    start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+    return [
+        {
+            "idempotency_key": str(i),
+            "fish_name": rng.choice(["Common", "Mirror", "Leather", "Grass"]),
+            "weight": round(rng.uniform(2, 25), 2),
+            "venue": rng.choice(["Lake A", "Lake B", "River C"]),
+            "caught_at": (start + timedelta(minutes=rng.randrange(3 * 365 * 24 * 60))).isoformat(),
+        }
+        for i in range(count)
+    ]
+
+
+def run(catches: int, requests: int, seed: int = 0) -> Dict[str, List[float]]:
+    """Seed `catches` catches and return request timings (ms) per endpoint"""
+    # Configuration is read when the modules are imported, so set it first
+    os.environ["STORAGE_BACKEND"] = "memory"
+    os.environ.setdefault("STATS_CACHE_TTL_SECONDS", "0")
+    os.environ.setdefault("RUN_JOB_WORKER", "false")
+    from fastapi.testclient import TestClient
+    import server
+
+    # httpx logs every request at INFO
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    timings = {name: [] for name, _, _ in ENDPOINTS}
+    with TestClient(server.app) as client:
+        email = f"bench-{uuid.uuid4().hex[:8]}@example.com"
+        client.post("/api/auth/register", json={"email": email, "password": "benchmark"})
+        token = client.post("/api/auth/login", data={"username": email, "password": "benchmark"}).json()
+        headers = {"Authorization": f"Bearer {token['access_token']}"}
+
+        items = random_catches(catches, seed)
+        for i in range(0, len(items), server.CATCH_BATCH_MAX_ITEMS):
+            response = client.post("/api/catches/batch", json=items[i:i + server.CATCH_BATCH_MAX_ITEMS], headers=headers)
+            response.raise_for_status()
+
+        for _ in range(requests):
+            for name, path, params in ENDPOINTS:
+                started = time.perf_counter()
+                client.get(path, params=params, headers=headers).raise_for_status()
+                timings[name].append((time.perf_counter() - started) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carplog-Pro in-memory API benchmark")
+    parser.add_argument("--catches", type=int, default=2000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    timings = run(args.catches, args.requests, args.seed)
+    print(f"{args.catches} catches, {args.requests} requests per endpoint")
+    for name, samples in timings.items():
+        samples.sort()
+        p95 = samples[int(len(samples) * 0.95) - 1] if len(samples) >= 20 else samples[-1]
+        print(f"{name:<15} mean {statistics.mean(samples):7.2f} ms   p95 {p95:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
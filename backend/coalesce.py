@@ -0,0 +1,87 @@
+"""Request coalescing (single-flight) with a short-lived result cache.
+
+Concurrent identical requests for an expensive read share one in-flight
+computation instead of each running the same full scan. Keys include a data
+version that write paths bump, so a user's stats are recomputed right after
+they log or delete a catch; results are otherwise reused for at most
+STATS_CACHE_TTL_SECONDS.
+
+Versions are per process. With several API processes, a write handled by one
+of them reaches the others' caches only when the TTL expires.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict, defaultdict
+from typing import Awaitable, Callable, Hashable
+
+STATS_CACHE_TTL_SECONDS = float(os.environ.get('STATS_CACHE_TTL_SECONDS', '5'))
+STATS_CACHE_MAX_ENTRIES = int(os.environ.get('STATS_CACHE_MAX_ENTRIES', '1000'))
+
+
+class SingleFlight:
+    def __init__(self, ttl: float = STATS_CACHE_TTL_SECONDS, max_entries: int = STATS_CACHE_MAX_ENTRIES,
+                 clock: Callable[[], float] = time.monotonic):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.clock = clock
+        self._versions = defaultdict(int)
+        self._in_flight = {}
+        self._cache: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.requests = 0
+        self.computed = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+
+    def version(self, scope: Hashable) -> int:
+        # Reads must not insert: only scopes that have been written are tracked
+        return self._versions.get(scope, 0)
+
+    def bump(self, scope: Hashable):
+        """Mark data in `scope` as changed; later keys built with version() miss the cache"""
+        self._versions[scope] += 1
+
+    async def do(self, key: Hashable, compute: Callable[[], Awaitable]):
+        """Return the cached or in-flight result for `key`, computing it at most once"""
+        self.requests += 1
+        cached = self._cache.get(key)
+        if cached is not None:
+            expires, value = cached
+            if expires > self.clock():
+                self.cache_hits += 1
+                self._cache.move_to_end(key)
+                return value
+            del self._cache[key]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.computed += 1
+            # Run as its own task so a disconnecting caller does not cancel
+            # the computation for everyone waiting on it
+            task = asyncio.ensure_future(compute())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Future):
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._cache[key] = (self.clock() + self.ttl, task.result())
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "computed": self.computed,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "in_flight": len(self._in_flight),
+            "cached_entries": len(self._cache),
+        }
+
+
+stats_flight = SingleFlight()
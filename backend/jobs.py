@@ -0,0 +1,223 @@
+"""Persistent background job queue, stored through the storage layer.
+
+Write endpoints enqueue follow-up work and return as soon as their own write
+is durable. Workers claim jobs atomically, hold them for a visibility timeout
+(extended by a heartbeat while the handler runs) and retry failures with
+exponential backoff. A job whose worker died becomes claimable again once its
+lock expires. Succeeded and failed jobs are deleted JOB_RETENTION_DAYS after
+they finish.
+
+Workers run inside the API process (RUN_JOB_WORKER=true, the default) or on
+their own, from the backend directory:
+
+    python -m jobs
+"""
+import asyncio
+import logging
+import os
+import random
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import analytics_store
+import astro
+import coalesce
+
+JOB_WORKER_CONCURRENCY = int(os.environ.get('JOB_WORKER_CONCURRENCY', '4'))
+JOB_VISIBILITY_TIMEOUT_SECONDS = int(os.environ.get('JOB_VISIBILITY_TIMEOUT_SECONDS', '60'))
+JOB_POLL_INTERVAL_SECONDS = float(os.environ.get('JOB_POLL_INTERVAL_SECONDS', '1'))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+JOB_BACKOFF_BASE_SECONDS = float(os.environ.get('JOB_BACKOFF_BASE_SECONDS', '5'))
+JOB_BACKOFF_MAX_SECONDS = float(os.environ.get('JOB_BACKOFF_MAX_SECONDS', '3600'))
+JOB_RETENTION_DAYS = float(os.environ.get('JOB_RETENTION_DAYS', '7'))
+
+# Terminal states get a `finished_at`, which the storage layer expires on
+FINISHED_STATUSES = ("succeeded", "failed")
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[object, dict], Awaitable[Optional[dict]]]
+HANDLERS: Dict[str, Handler] = {}
+
+
+def job_handler(job_type: str):
+    """Register an async handler `(storage, payload) -> optional result dict`"""
+    def register(func: Handler) -> Handler:
+        HANDLERS[job_type] = func
+        return func
+    return register
+
+
+def _new_job(job_type: str, payload: dict, user_id: Optional[str] = None,
+             max_attempts: int = JOB_MAX_ATTEMPTS, delay_seconds: float = 0) -> dict:
+    now = datetime.now(timezone.utc)
+    return {
+        "id": str(uuid.uuid4()),
+        "type": job_type,
+        "payload": payload,
+        "user_id": user_id,
+        "status": "queued",
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "run_at": now + timedelta(seconds=delay_seconds),
+        "locked_until": None,
+        "lock_token": None,
+        "last_error": None,
+        "result": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+async def enqueue(storage, job_type: str, payload: dict, **options) -> str:
+    job = _new_job(job_type, payload, **options)
+    await storage.jobs.insert_many([job])
+    return job["id"]
+
+
+async def enqueue_many(storage, jobs: List[tuple], **options) -> List[str]:
+    """Enqueue several `(job_type, payload)` pairs in one write"""
+    docs = [_new_job(job_type, payload, **options) for job_type, payload in jobs]
+    if docs:
+        await storage.jobs.insert_many(docs)
+    return [doc["id"] for doc in docs]
+
+
+def backoff_seconds(attempts: int) -> float:
+    delay = min(JOB_BACKOFF_MAX_SECONDS, JOB_BACKOFF_BASE_SECONDS * 2 ** (attempts - 1))
+    # Jitter keeps retries of jobs that failed together from retrying together
+    return delay * random.uniform(0.5, 1.0)
+
+
+class JobWorker:
+    def __init__(self, storage, concurrency: int = JOB_WORKER_CONCURRENCY,
+                 visibility_timeout: int = JOB_VISIBILITY_TIMEOUT_SECONDS,
+                 poll_interval: float = JOB_POLL_INTERVAL_SECONDS):
+        self.storage = storage
+        self.concurrency = concurrency
+        self.visibility_timeout = visibility_timeout
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._slots = asyncio.Semaphore(concurrency)
+        self._running = set()
+
+    async def claim(self) -> Optional[dict]:
+        return await self.storage.jobs.claim(list(HANDLERS), self.worker_id, self.visibility_timeout)
+
+    async def _heartbeat(self, job: dict):
+        while True:
+            await asyncio.sleep(self.visibility_timeout / 2)
+            try:
+                await self.storage.jobs.extend_lock(job, self.visibility_timeout)
+            except Exception:
+                # Keep beating: a later extension can still land before the lock expires
+                logger.exception("Failed to extend lock on job %s", job["id"])
+
+    async def _finish(self, job: dict, fields: dict):
+        fields["updated_at"] = datetime.now(timezone.utc)
+        fields["locked_until"] = None
+        if fields["status"] in FINISHED_STATUSES:
+            fields["finished_at"] = fields["updated_at"]
+        await self.storage.jobs.finish(job, fields)
+
+    async def run_job(self, job: dict):
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        try:
+            result = await HANDLERS[job["type"]](self.storage, job["payload"])
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning("Job %s (%s) attempt %d failed: %s", job["id"], job["type"], job["attempts"], e)
+            if job["attempts"] >= job["max_attempts"]:
+                await self._finish(job, {"status": "failed", "last_error": str(e)})
+            else:
+                run_at = datetime.now(timezone.utc) + timedelta(seconds=backoff_seconds(job["attempts"]))
+                await self._finish(job, {"status": "queued", "run_at": run_at, "last_error": str(e)})
+        else:
+            await self._finish(job, {"status": "succeeded", "result": result})
+        finally:
+            heartbeat.cancel()
+
+    async def _run_slot(self, job: dict):
+        try:
+            await self.run_job(job)
+        finally:
+            self._slots.release()
+
+    async def run(self):
+        """Claim and run jobs until cancelled, at most `concurrency` at a time"""
+        logger.info("Job worker %s started (concurrency=%d)", self.worker_id, self.concurrency)
+        try:
+            while True:
+                await self._slots.acquire()
+                try:
+                    job = await self.claim()
+                except Exception:
+                    self._slots.release()
+                    logger.exception("Failed to claim job")
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                if job is None:
+                    self._slots.release()
+                    await asyncio.sleep(self.poll_interval)
+                    continue
+                task = asyncio.create_task(self._run_slot(job))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+        finally:
+            for task in list(self._running):
+                task.cancel()
+
+
+# Handlers
+
+@job_handler("catch_logged")
+async def record_catch_logged(storage, payload: dict):
+    """Count a logged catch in analytics (covers batched/offline uploads too)"""
+    await storage.analytics.record(analytics_store.build_event(
+        event_type="catch_logged",
+        page=None,
+        device_type=payload.get("device_type"),
+        user_agent=payload.get("user_agent"),
+        visitor_id=payload["user_id"],
+    ))
+
+
+@job_handler("backfill_catch_environment")
+async def backfill_catch_environment(storage, payload: dict):
+    """Add moon/sun context to a user's catches that were logged without it"""
+    environments = {}
+    for catch in await storage.catches.list_missing_environment(payload["user_id"]):
+        caught_at = catch["caught_at"]
+        if isinstance(caught_at, str):
+            caught_at = datetime.fromisoformat(caught_at)
+        env = astro.environment_for(caught_at, catch.get("latitude"), catch.get("longitude"))
+        environments[catch["id"]] = astro.environment_document(env)
+    updated = await storage.catches.set_environments(environments)
+    coalesce.stats_flight.bump(("catches", payload["user_id"]))
+    return {"updated": updated}
+
+
+async def _main():
+    from dotenv import load_dotenv
+
+    from storage import create_storage
+
+    load_dotenv(Path(__file__).parent / '.env')
+    storage = create_storage()
+    try:
+        await storage.init()
+        await JobWorker(storage).run()
+    finally:
+        await storage.close()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(_main())
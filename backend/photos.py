@@ -0,0 +1,249 @@
+"""Catch photo uploads: streamed multipart parsing, sniffing and downscaling.
+
+The request body is parsed as it arrives and the file part is written to disk
+chunk by chunk, so request memory stays at one chunk regardless of photo size.
+The upload is rejected as soon as it passes PHOTO_MAX_UPLOAD_BYTES, and the
+image type is taken from the file's magic bytes, not the client's header.
+
+Downscaling to a display size and a thumbnail runs in a process pool so the
+event loop never decodes images. Only the two JPEG renditions are kept.
+"""
+import asyncio
+import os
+import re
+import tempfile
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+from typing import List, Optional
+
+from fastapi import HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+PHOTO_STORAGE_DIR = Path(os.environ.get('PHOTO_STORAGE_DIR', Path(__file__).parent / 'uploads' / 'photos'))
+PHOTO_MAX_UPLOAD_BYTES = int(os.environ.get('PHOTO_MAX_UPLOAD_BYTES', str(15 * 1024 * 1024)))
+PHOTO_DISPLAY_MAX_PX = int(os.environ.get('PHOTO_DISPLAY_MAX_PX', '1600'))
+PHOTO_THUMB_MAX_PX = int(os.environ.get('PHOTO_THUMB_MAX_PX', '320'))
+PHOTO_PROCESS_WORKERS = int(os.environ.get('PHOTO_PROCESS_WORKERS', '2'))
+
+PHOTO_URL_PREFIX = "/api/photos/"
+PHOTO_NAME_RE = re.compile(r"^[0-9a-f]{32}_(display|thumb)\.jpg$")
+
+# Allowance for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+# Decompression-bomb guard: a well-compressed photo of the maximum upload size
+# is unlikely to exceed ~4 pixels per byte; anything larger is refused before
+# decoding instead of being allowed to exhaust a worker's memory
+PHOTO_MAX_PIXELS = int(os.environ.get('PHOTO_MAX_PIXELS', str(PHOTO_MAX_UPLOAD_BYTES * 4)))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    return None
+
+
+class _FilePart:
+    """Multipart callbacks that collect the data of one named file field"""
+
+    def __init__(self, field: str):
+        self.field = field.encode()
+        self.found = False
+        self.complete = False
+        self.in_target = False
+        self.pending = bytearray()
+        self._headers = {}
+        self._header_field = bytearray()
+        self._header_value = bytearray()
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+        }
+
+    def on_part_begin(self):
+        self._headers = {}
+
+    def on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        self._headers[bytes(self._header_field).lower()] = bytes(self._header_value)
+        self._header_field.clear()
+        self._header_value.clear()
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition"))
+        self.in_target = not self.found and options.get(b"name") == self.field
+        self.found = self.found or self.in_target
+
+    def on_part_data(self, data, start, end):
+        if self.in_target:
+            self.pending += data[start:end]
+
+    def on_part_end(self):
+        if self.in_target:
+            self.in_target = False
+            self.complete = True
+
+
+async def receive_upload(request: Request, field: str = "file",
+                         max_bytes: int = PHOTO_MAX_UPLOAD_BYTES) -> Path:
+    """Stream the `field` file part of a multipart request to a temporary file"""
+    content_type, options = parse_options_header(request.headers.get("content-type"))
+    if content_type != b"multipart/form-data" or b"boundary" not in options:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail="Expected multipart/form-data")
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail=f"Photo must be at most {max_bytes // (1024 * 1024)} MB")
+
+    part = _FilePart(field)
+    parser = MultipartParser(options[b"boundary"], part.callbacks())
+    incoming = PHOTO_STORAGE_DIR / "incoming"
+    incoming.mkdir(parents=True, exist_ok=True)
+    handle = tempfile.NamedTemporaryFile(dir=incoming, delete=False)
+    path = Path(handle.name)
+
+    received = 0
+    body_received = 0
+    head = b""
+    try:
+        async for chunk in request.stream():
+            # Bound the whole body too: a chunked request has no Content-Length
+            # and could otherwise send unlimited data in other parts
+            body_received += len(chunk)
+            if body_received > max_bytes + MULTIPART_OVERHEAD_BYTES:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                    detail=f"Photo must be at most {max_bytes // (1024 * 1024)} MB")
+            parser.write(chunk)
+            if not part.pending:
+                continue
+            received += len(part.pending)
+            if received > max_bytes:
+                raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                                    detail=f"Photo must be at most {max_bytes // (1024 * 1024)} MB")
+            if len(head) < 12:
+                head += bytes(part.pending[:12 - len(head)])
+                if len(head) >= 12 and sniff_image_type(head) is None:
+                    raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                                        detail="Photo must be a JPEG, PNG, WebP or GIF image")
+            await run_in_threadpool(handle.write, bytes(part.pending))
+            part.pending.clear()
+        parser.finalize()
+
+        if not part.complete or received == 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"Missing '{field}' file field")
+        if sniff_image_type(head) is None:
+            raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                                detail="Photo must be a JPEG, PNG, WebP or GIF image")
+    except BaseException:
+        handle.close()
+        path.unlink(missing_ok=True)
+        raise
+    handle.close()
+    return path
+
+
+def _render(src: str, dest_dir: str, photo_id: str, display_px: int, thumb_px: int, max_pixels: int) -> None:
+    """Process-pool worker: write display and thumbnail JPEGs"""
+    from PIL import Image, ImageOps
+
+    # Pillow raises DecompressionBombError above twice this limit and only warns
+    # between the two, so set it to half
+    Image.MAX_IMAGE_PIXELS = max_pixels // 2
+    with Image.open(src) as image:
+        # Let the JPEG decoder skip detail we are about to throw away
+        image.draft("RGB", (display_px, display_px))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        image.thumbnail((display_px, display_px))
+        image.save(os.path.join(dest_dir, f"{photo_id}_display.jpg"), "JPEG", quality=85, optimize=True)
+        image.thumbnail((thumb_px, thumb_px))
+        image.save(os.path.join(dest_dir, f"{photo_id}_thumb.jpg"), "JPEG", quality=80, optimize=True)
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=PHOTO_PROCESS_WORKERS)
+    return _pool
+
+
+async def store_photo(upload_path: Path) -> dict:
+    """Downscale an uploaded image; return the display and thumbnail URLs"""
+    photo_id = uuid.uuid4().hex
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(
+            _get_pool(), _render, str(upload_path), str(PHOTO_STORAGE_DIR),
+            photo_id, PHOTO_DISPLAY_MAX_PX, PHOTO_THUMB_MAX_PX, PHOTO_MAX_PIXELS,
+        )
+    except BrokenProcessPool:
+        # A worker died (e.g. killed for memory); later uploads need a fresh pool
+        _reset_pool()
+        delete_photo_files([f"{PHOTO_URL_PREFIX}{photo_id}_display.jpg"])
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Photo processing is temporarily unavailable, try again",
+                            headers={"Retry-After": "5"})
+    except Exception:
+        delete_photo_files([f"{PHOTO_URL_PREFIX}{photo_id}_display.jpg"])
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="Photo could not be decoded")
+    finally:
+        upload_path.unlink(missing_ok=True)
+    return {
+        "photo_url": f"{PHOTO_URL_PREFIX}{photo_id}_display.jpg",
+        "thumbnail_url": f"{PHOTO_URL_PREFIX}{photo_id}_thumb.jpg",
+    }
+
+
+def photo_path(name: str) -> Optional[Path]:
+    """Path of a stored rendition, or None for names we never generate"""
+    if not PHOTO_NAME_RE.match(name):
+        return None
+    return PHOTO_STORAGE_DIR / name
+
+
+def delete_photo_files(urls: List[Optional[str]]) -> None:
+    """Remove both renditions of every photo referenced by `urls`"""
+    for url in urls:
+        if not url or not url.startswith(PHOTO_URL_PREFIX):
+            continue
+        photo_id = url[len(PHOTO_URL_PREFIX):].split("_", 1)[0]
+        for suffix in ("display", "thumb"):
+            path = photo_path(f"{photo_id}_{suffix}.jpg")
+            if path:
+                path.unlink(missing_ok=True)
+
+
+def _reset_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def shutdown() -> None:
+    _reset_pool()
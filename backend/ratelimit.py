@@ -0,0 +1,181 @@
+"""In-process rate limiting and load shedding for unauthenticated hot endpoints.
+
+Limits are token buckets keyed by client IP (or any other key, e.g. IP and
+login email). Each limited route reads its limit from an environment variable of the
+form "<count>/<second|minute|hour>", e.g. RATE_LIMIT_LOGIN="10/minute".
+
+Admission control watches in-flight requests and event-loop lag; when either
+passes its threshold, routes marked low priority (analytics) are answered with
+503 before they touch the database, leaving capacity for logged-in users.
+"""
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from typing import Callable, Hashable
+
+from fastapi import HTTPException, Request, status
+
+PERIOD_SECONDS = {"second": 1, "minute": 60, "hour": 3600}
+
+# Behind a reverse proxy every request comes from the proxy address; only
+# trust X-Forwarded-For when the proxy is known to set it
+TRUST_FORWARDED_FOR = os.environ.get('RATE_LIMIT_TRUST_FORWARDED_FOR', 'false').lower() in ('1', 'true', 'yes')
+MAX_TRACKED_KEYS = int(os.environ.get('RATE_LIMIT_MAX_KEYS', '10000'))
+
+MAX_IN_FLIGHT_REQUESTS = int(os.environ.get('MAX_IN_FLIGHT_REQUESTS', '200'))
+MAX_EVENT_LOOP_LAG_MS = float(os.environ.get('MAX_EVENT_LOOP_LAG_MS', '100'))
+LAG_SAMPLE_INTERVAL_SECONDS = 0.05
+
+
+def parse_limit(value: str):
+    """Parse "10/minute" into (tokens per second, burst capacity)"""
+    count, _, period = value.partition('/')
+    count = int(count)
+    seconds = PERIOD_SECONDS[period.strip() or "second"]
+    return count / seconds, count
+
+
+class TokenBucket:
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float, now: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def wait(self, now: float) -> float:
+        """Seconds until a token is available (0 if one is available now)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> float:
+        """Consume one token; return 0 on success or the seconds until one is available"""
+        retry_after = self.wait(now)
+        if not retry_after:
+            self.tokens -= 1
+        return retry_after
+
+
+class RateLimiter:
+    """A set of token buckets sharing one limit, keyed by client"""
+
+    def __init__(self, name: str, limit: str, max_keys: int = MAX_TRACKED_KEYS,
+                 clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.rate, self.capacity = parse_limit(limit)
+        self.max_keys = max_keys
+        self.clock = clock
+        self.buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.rejected = 0
+
+    def hit(self, key: Hashable):
+        """Consume a token for `key`, raising 429 when the bucket is empty"""
+        now = self.clock()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(self.rate, self.capacity, now)
+            # Least recently seen keys are dropped first; a dropped key simply
+            # starts again with a full bucket
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        self._raise_if_waiting(bucket.take(now))
+
+    def refund(self, key: Hashable):
+        """Give back a token taken by hit(), e.g. once an attempt turns out to be allowed"""
+        bucket = self.buckets.get(key)
+        if bucket is not None:
+            bucket.tokens = min(bucket.capacity, bucket.tokens + 1)
+
+    def _raise_if_waiting(self, retry_after: float):
+        if retry_after:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many requests",
+                headers={"Retry-After": str(max(1, round(retry_after)))},
+            )
+
+
+def client_ip(request: Request) -> str:
+    if TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+def configured_limiter(name: str, default: str) -> RateLimiter:
+    """RateLimiter whose limit can be overridden by RATE_LIMIT_<NAME>"""
+    return RateLimiter(name, os.environ.get(f'RATE_LIMIT_{name.upper()}', default))
+
+
+def limit_by_ip(name: str, default: str):
+    """Dependency factory: per-IP limit configured by RATE_LIMIT_<NAME>"""
+    limiter = configured_limiter(name, default)
+
+    async def dependency(request: Request):
+        limiter.hit(client_ip(request))
+
+    dependency.limiter = limiter
+    return dependency
+
+
+class AdmissionController:
+    """Tracks load and sheds low-priority requests when overloaded"""
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT_REQUESTS,
+                 max_lag_ms: float = MAX_EVENT_LOOP_LAG_MS):
+        self.max_in_flight = max_in_flight
+        self.max_lag_ms = max_lag_ms
+        self.in_flight = 0
+        self.lag_ms = 0.0
+        self.shed = 0
+
+    @property
+    def overloaded(self) -> bool:
+        return self.in_flight > self.max_in_flight or self.lag_ms > self.max_lag_ms
+
+    async def middleware(self, request: Request, call_next):
+        self.in_flight += 1
+        try:
+            return await call_next(request)
+        finally:
+            self.in_flight -= 1
+
+    async def monitor_event_loop_lag(self, interval: float = LAG_SAMPLE_INTERVAL_SECONDS):
+        """Background task: measure how late the loop wakes us up"""
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            lag_ms = max(0.0, (loop.time() - started - interval) * 1000)
+            # Smooth so a single slow tick does not flip shedding on and off
+            self.lag_ms = 0.7 * self.lag_ms + 0.3 * lag_ms
+
+    async def shed_low_priority(self):
+        """Dependency for low-priority routes: reject with 503 while overloaded"""
+        if self.overloaded:
+            self.shed += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, try again later",
+                headers={"Retry-After": "5"},
+            )
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "event_loop_lag_ms": round(self.lag_ms, 2),
+            "overloaded": self.overloaded,
+            "shed": self.shed,
+        }
+
+
+admission = AdmissionController()
@@ -1,8 +1,9 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Request, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.responses import FileResponse
+from fastapi.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
 import os
 import logging
 from pathlib import Path
@@ -14,25 +15,64 @@ import base64
 from collections import defaultdict
 from passlib.context import CryptContext
 from jose import JWTError, jwt
+from contextlib import asynccontextmanager
+import asyncio
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# Local modules read their configuration from the environment at import
+import analytics_store
+import astro
+import coalesce
+import jobs
+import photos
+import ratelimit
+from storage import DUPLICATE, Storage, create_storage
+
 # Security Configuration
 SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Offline sync: maximum number of catches accepted by one batch request
+CATCH_BATCH_MAX_ITEMS = int(os.environ.get('CATCH_BATCH_MAX_ITEMS', '100'))
+
+# Dawn breakdown: 30 minute windows within 3 hours either side of sunrise
+DAWN_WINDOW_MINUTES = 30
+DAWN_WINDOW_RANGE_MINUTES = 180
+
+# Run a background job worker inside the API process (disable when running `python -m jobs`)
+RUN_JOB_WORKER = os.environ.get('RUN_JOB_WORKER', 'true').lower() in ('1', 'true', 'yes')
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/login")
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Storage backend (STORAGE_BACKEND=mongo|memory) is created per app, not at import
+    storage = create_storage()
+    await storage.init()
+    app.state.storage = storage
+    
+    background = [
+        asyncio.create_task(analytics_store.run_compaction_loop(storage.analytics)),
+        asyncio.create_task(ratelimit.admission.monitor_event_loop_lag()),
+    ]
+    if RUN_JOB_WORKER:
+        background.append(asyncio.create_task(jobs.JobWorker(storage).run()))
+    
+    yield
+    
+    for task in background:
+        task.cancel()
+    photos.shutdown()
+    await storage.close()
 
 # Create the main app
-app = FastAPI(title="Carplog-Pro API")
+app = FastAPI(title="Carplog-Pro API", lifespan=lifespan)
 
 # CORS - Allow all origins for simplicity
 app.add_middleware(
@@ -43,6 +83,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Admission control: count in-flight requests so low-priority work can be shed
+app.middleware("http")(ratelimit.admission.middleware)
+
+# Rate limits for unauthenticated endpoints (override with RATE_LIMIT_<NAME>)
+limit_login_by_ip = ratelimit.limit_by_ip("login", "20/minute")
+limit_track_by_ip = ratelimit.limit_by_ip("analytics_track", "60/minute")
+# Failed logins per (IP, account): successful logins get their token back, and the key
+# includes the IP so guessing from elsewhere cannot lock the account owner out
+login_user_limiter = ratelimit.configured_limiter("login_user", "5/minute")
+
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
 
@@ -63,7 +113,10 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-async def get_current_user(token: str = Depends(oauth2_scheme)):
+def get_storage(request: Request) -> Storage:
+    return request.app.state.storage
+
+async def get_current_user(token: str = Depends(oauth2_scheme), storage: Storage = Depends(get_storage)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -77,7 +130,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
     
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user = await storage.users.get_by_id(user_id)
     if user is None:
         raise credentials_exception
     return user
@@ -149,6 +202,16 @@ class Token(BaseModel):
     token_type: str
 
 # Catch Models
+class CatchEnvironment(BaseModel):
+    moon_phase: str
+    moon_illumination: float
+    moon_age_days: float
+    # Sun fields are only available when the catch has venue coordinates
+    sunrise: Optional[datetime] = None
+    sunset: Optional[datetime] = None
+    minutes_from_sunrise: Optional[int] = None
+    minutes_from_sunset: Optional[int] = None
+
 class Catch(BaseModel):
     model_config = ConfigDict(extra="ignore")
     
@@ -163,8 +226,15 @@ class Catch(BaseModel):
     wraps_count: Optional[int] = None
     bait_used: Optional[str] = None
     photo_base64: Optional[str] = None
+    # Set by POST /catches/{id}/photo; served from GET /api/photos/{name}
+    photo_url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
     caught_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
     notes: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    environment: Optional[CatchEnvironment] = None
+    idempotency_key: Optional[str] = None
 
 class CatchCreate(BaseModel):
     fish_name: Optional[str] = None
@@ -178,6 +248,56 @@ class CatchCreate(BaseModel):
     photo_base64: Optional[str] = None
     caught_at: Optional[datetime] = None
     notes: Optional[str] = None
+    latitude: Optional[float] = Field(default=None, ge=-90, le=90)
+    longitude: Optional[float] = Field(default=None, ge=-180, le=180)
+
+class CatchBatchItem(CatchCreate):
+    # Client-generated key (e.g. a UUID created when the catch was queued offline)
+    idempotency_key: str = Field(min_length=1, max_length=128)
+
+class CatchBatchItemResult(BaseModel):
+    index: int
+    idempotency_key: str
+    status: str  # 'created', 'duplicate', 'error'
+    catch: Optional[Catch] = None
+    detail: Optional[str] = None
+
+class CatchBatchResponse(BaseModel):
+    created: int
+    duplicates: int
+    errors: int
+    results: List[CatchBatchItemResult]
+
+class MoonPhaseStats(BaseModel):
+    moon_phase: str
+    total_count: int
+    total_weight: float
+    average_weight: float
+
+class DawnWindowStats(BaseModel):
+    minutes_from: int  # window start, minutes relative to sunrise
+    minutes_to: int
+    total_count: int
+    total_weight: float
+    average_weight: float
+
+class EnvironmentStats(BaseModel):
+    moon_phases: List[MoonPhaseStats]
+    dawn_windows: List[DawnWindowStats]
+
+class JobStatus(BaseModel):
+    model_config = ConfigDict(extra="ignore")
+    
+    id: str
+    type: str
+    status: str  # 'queued', 'running', 'succeeded', 'failed'
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    last_error: Optional[str] = None
+    result: Optional[dict] = None
+    created_at: datetime
+    updated_at: datetime
 
 class MonthlyStats(BaseModel):
     month: int
@@ -196,10 +316,10 @@ class YearlyStats(BaseModel):
 
 # Authentication Routes
 @api_router.post("/auth/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user_data: UserCreate):
+async def register(user_data: UserCreate, storage: Storage = Depends(get_storage)):
     """Register a new user"""
     # Check if user already exists
-    existing_user = await db.users.find_one({"email": user_data.email})
+    existing_user = await storage.users.get_by_email(user_data.email)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -210,14 +330,14 @@ async def register(user_data: UserCreate):
     initial_profile = UserProfile(name=user_data.name)
     user = User(
         email=user_data.email,
-        hashed_password=get_password_hash(user_data.password),
+        hashed_password=await run_in_threadpool(get_password_hash, user_data.password),
         profile=initial_profile
     )
     
     user_dict = user.model_dump()
     user_dict['created_at'] = user_dict['created_at'].isoformat()
     
-    await db.users.insert_one(user_dict)
+    await storage.users.create(user_dict)
     
     return UserResponse(
         id=user.id,
@@ -226,17 +346,28 @@ async def register(user_data: UserCreate):
         created_at=user.created_at
     )
 
-@api_router.post("/auth/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
+@api_router.post("/auth/login", response_model=Token, dependencies=[Depends(limit_login_by_ip)])
+async def login(
+    request: Request,
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    storage: Storage = Depends(get_storage)
+):
     """Login and get access token"""
-    user = await db.users.find_one({"email": form_data.username}, {"_id": 0})
+    # Reserve a token before the database lookup and bcrypt check, so concurrent
+    # attempts cannot all get through before any failure is counted
+    attempt_key = (ratelimit.client_ip(request), form_data.username.lower())
+    login_user_limiter.hit(attempt_key)
+    
+    user = await storage.users.get_by_email(form_data.username)
     
-    if not user or not verify_password(form_data.password, user["hashed_password"]):
+    # bcrypt is deliberately slow; keep it off the event loop
+    if not user or not await run_in_threadpool(verify_password, form_data.password, user["hashed_password"]):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    login_user_limiter.refund(attempt_key)
     
     access_token = create_access_token(data={"sub": user["id"]})
     return {"access_token": access_token, "token_type": "bearer"}
@@ -252,14 +383,13 @@ async def get_current_user_profile(current_user: dict = Depends(get_current_user
     )
 
 @api_router.put("/auth/profile", response_model=UserResponse)
-async def update_profile(profile_update: UserProfile, current_user: dict = Depends(get_current_user)):
+async def update_profile(
+    profile_update: UserProfile,
+    current_user: dict = Depends(get_current_user),
+    storage: Storage = Depends(get_storage)
+):
     """Update user profile"""
-    await db.users.update_one(
-        {"id": current_user["id"]},
-        {"$set": {"profile": profile_update.model_dump()}}
-    )
-    
-    updated_user = await db.users.find_one({"id": current_user["id"]}, {"_id": 0})
+    updated_user = await storage.users.update_profile(current_user["id"], profile_update.model_dump())
     
     return UserResponse(
         id=updated_user["id"],
@@ -268,32 +398,139 @@ async def update_profile(profile_update: UserProfile, current_user: dict = Depen
         created_at=datetime.fromisoformat(updated_user["created_at"])
     )
 
-# Catch Routes (with optional authentication)
-@api_router.post("/catches", response_model=Catch, status_code=status.HTTP_201_CREATED)
-async def create_catch(catch_input: CatchCreate, current_user: dict = Depends(get_current_user)):
-    """Log a new catch"""
-    catch_dict = catch_input.model_dump(exclude_unset=True)
-    
+def new_catch(catch_dict: dict, user_id: str) -> Catch:
+    """Build a catch from client input and enrich it with moon/sun context"""
     if 'caught_at' in catch_dict and catch_dict['caught_at'] is None:
         del catch_dict['caught_at']
     
-    catch_obj = Catch(**catch_dict, user_id=current_user["id"])
-    
+    catch_obj = Catch(**catch_dict, user_id=user_id)
+    catch_obj.environment = CatchEnvironment(
+        **astro.environment_for(catch_obj.caught_at, catch_obj.latitude, catch_obj.longitude)
+    )
+    return catch_obj
+
+def catch_document(catch_obj: Catch) -> dict:
     doc = catch_obj.model_dump()
     doc['caught_at'] = doc['caught_at'].isoformat()
+    if doc['environment']:
+        doc['environment'] = astro.environment_document(doc['environment'])
+    return doc
+
+def catches_version(user_id: str) -> int:
+    return coalesce.stats_flight.version(("catches", user_id))
+
+async def enqueue_catch_followups(storage: Storage, catch_objs: List[Catch], request: Request):
+    """Queue post-write work for newly stored catches"""
+    if not catch_objs:
+        return
+    # The client no longer sends its own catch_logged event, so record its device here
+    user_agent = request.headers.get("user-agent")
+    client = {"user_agent": user_agent, "device_type": analytics_store.device_type_from_user_agent(user_agent)}
+    try:
+        await jobs.enqueue_many(storage, [
+            ("catch_logged", {"catch_id": c.id, "user_id": c.user_id, **client}) for c in catch_objs
+        ], user_id=catch_objs[0].user_id)
+    except Exception:
+        # The catch itself is stored; failing the request would make the client retry it
+        logger.exception("Failed to enqueue follow-up jobs for %d catch(es)", len(catch_objs))
+
+# Catch Routes (with optional authentication)
+@api_router.post("/catches", response_model=Catch, status_code=status.HTTP_201_CREATED)
+async def create_catch(
+    catch_input: CatchCreate,
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+    storage: Storage = Depends(get_storage)
+):
+    """Log a new catch"""
+    catch_obj = new_catch(catch_input.model_dump(exclude_unset=True), current_user["id"])
     
-    await db.catches.insert_one(doc)
+    await storage.catches.insert(catch_document(catch_obj))
+    coalesce.stats_flight.bump(("catches", catch_obj.user_id))
+    await enqueue_catch_followups(storage, [catch_obj], request)
     return catch_obj
 
+@api_router.post("/catches/batch", response_model=CatchBatchResponse)
+async def create_catches_batch(
+    items: List[CatchBatchItem],
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+    storage: Storage = Depends(get_storage)
+):
+    """Log several queued catches in one round trip (safe to retry)"""
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch must contain at least one catch")
+    if len(items) > CATCH_BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch may contain at most {CATCH_BATCH_MAX_ITEMS} catches"
+        )
+    
+    catch_objs = []
+    docs = []
+    for item in items:
+        catch_dict = item.model_dump(exclude_unset=True)
+        catch_dict['idempotency_key'] = item.idempotency_key
+        
+        catch_obj = new_catch(catch_dict, current_user["id"])
+        catch_objs.append(catch_obj)
+        docs.append(catch_document(catch_obj))
+    
+    # One bulk write; items whose key is already stored come back as DUPLICATE
+    failed = await storage.catches.insert_many(docs)
+    if len(failed) < len(docs):
+        coalesce.stats_flight.bump(("catches", current_user["id"]))
+    
+    # Items rejected by the unique index were already stored by an earlier attempt
+    duplicate_keys = [items[i].idempotency_key for i, err in failed.items() if err == DUPLICATE]
+    existing = {}
+    if duplicate_keys:
+        stored = await storage.catches.find_by_idempotency_keys(current_user["id"], duplicate_keys)
+        for catch in stored:
+            if isinstance(catch['caught_at'], str):
+                catch['caught_at'] = datetime.fromisoformat(catch['caught_at'])
+            existing[catch['idempotency_key']] = Catch(**catch)
+    
+    await enqueue_catch_followups(storage, [c for i, c in enumerate(catch_objs) if i not in failed], request)
+    
+    results = []
+    for i, (item, catch_obj) in enumerate(zip(items, catch_objs)):
+        if i not in failed:
+            results.append(CatchBatchItemResult(
+                index=i, idempotency_key=item.idempotency_key, status="created", catch=catch_obj
+            ))
+        elif failed[i] == DUPLICATE:
+            results.append(CatchBatchItemResult(
+                index=i,
+                idempotency_key=item.idempotency_key,
+                status="duplicate",
+                catch=existing.get(item.idempotency_key)
+            ))
+        else:
+            results.append(CatchBatchItemResult(
+                index=i,
+                idempotency_key=item.idempotency_key,
+                status="error",
+                detail=failed[i]
+            ))
+    
+    return CatchBatchResponse(
+        created=sum(1 for r in results if r.status == "created"),
+        duplicates=sum(1 for r in results if r.status == "duplicate"),
+        errors=sum(1 for r in results if r.status == "error"),
+        results=results
+    )
+
 @api_router.get("/catches", response_model=List[Catch])
 async def get_catches(
     year: Optional[int] = None,
     month: Optional[int] = None,
     limit: int = 100,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    storage: Storage = Depends(get_storage)
 ):
     """Get user's catches"""
-    query = {"user_id": current_user["id"]}
+    start_date = end_date = None
     
     if year or month:
         if year and month:
@@ -302,19 +539,13 @@ async def get_catches(
                 end_date = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
             else:
                 end_date = datetime(year, month + 1, 1, tzinfo=timezone.utc)
-            query['caught_at'] = {
-                '$gte': start_date.isoformat(),
-                '$lt': end_date.isoformat()
-            }
         elif year:
             start_date = datetime(year, 1, 1, tzinfo=timezone.utc)
             end_date = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
-            query['caught_at'] = {
-                '$gte': start_date.isoformat(),
-                '$lt': end_date.isoformat()
-            }
     
-    catches = await db.catches.find(query, {"_id": 0}).sort('caught_at', -1).to_list(limit)
+    catches = await storage.catches.list_for_user(
+        current_user["id"], start_date, end_date, limit=limit, newest_first=True
+    )
     
     for catch in catches:
         if isinstance(catch['caught_at'], str):
@@ -322,27 +553,71 @@ async def get_catches(
     
     return catches
 
+@api_router.post("/catches/environment/backfill", status_code=status.HTTP_202_ACCEPTED)
+async def backfill_catch_environment(
+    current_user: dict = Depends(get_current_user),
+    storage: Storage = Depends(get_storage)
+):
+    """Queue moon/sun enrichment for the user's catches logged before it existed"""
+    job_id = await jobs.enqueue(
+        storage, "backfill_catch_environment", {"user_id": current_user["id"]}, user_id=current_user["id"]
+    )
+    return {"job_id": job_id}
+
 @api_router.delete("/catches/{catch_id}")
-async def delete_catch(catch_id: str, current_user: dict = Depends(get_current_user)):
+async def delete_catch(
+    catch_id: str,
+    current_user: dict = Depends(get_current_user),
+    storage: Storage = Depends(get_storage)
+):
     """Delete a catch"""
-    result = await db.catches.delete_one({"id": catch_id, "user_id": current_user["id"]})
-    if result.deleted_count == 0:
+    deleted = await storage.catches.delete(current_user["id"], catch_id)
+    if not deleted:
         raise HTTPException(status_code=404, detail="Catch not found")
+    coalesce.stats_flight.bump(("catches", current_user["id"]))
+    photos.delete_photo_files([deleted.get("photo_url")])
     return {"message": "Catch deleted successfully"}
 
-@api_router.get("/stats/monthly", response_model=List[MonthlyStats])
-async def get_monthly_stats(year: int, current_user: dict = Depends(get_current_user)):
-    """Get monthly statistics for user"""
+@api_router.post("/catches/{catch_id}/photo", response_model=Catch)
+async def upload_catch_photo(
+    catch_id: str,
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+    storage: Storage = Depends(get_storage)
+):
+    """Attach a photo to a catch (multipart/form-data, field \"file\")"""
+    existing = await storage.catches.get(current_user["id"], catch_id)
+    if not existing:
+        raise HTTPException(status_code=404, detail="Catch not found")
+    
+    # Streamed to disk with size and type checks, then downscaled off the event loop
+    upload_path = await photos.receive_upload(request)
+    urls = await photos.store_photo(upload_path)
+    
+    catch = await storage.catches.set_photo(current_user["id"], catch_id, {**urls, "photo_base64": None})
+    if not catch:
+        photos.delete_photo_files([urls["photo_url"]])
+        raise HTTPException(status_code=404, detail="Catch not found")
+    photos.delete_photo_files([existing.get("photo_url")])
+    
+    if isinstance(catch['caught_at'], str):
+        catch['caught_at'] = datetime.fromisoformat(catch['caught_at'])
+    return Catch(**catch)
+
+@api_router.get("/photos/{name}")
+async def get_photo(name: str):
+    """Serve a stored photo rendition; names are unique per upload, so cache forever"""
+    path = photos.photo_path(name)
+    if path is None or not path.is_file():
+        raise HTTPException(status_code=404, detail="Photo not found")
+    return FileResponse(path, media_type="image/jpeg",
+                        headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+async def compute_monthly_stats(storage: Storage, user_id: str, year: int) -> List[MonthlyStats]:
     start_date = datetime(year, 1, 1, tzinfo=timezone.utc)
     end_date = datetime(year + 1, 1, 1, tzinfo=timezone.utc)
     
-    catches = await db.catches.find({
-        'user_id': current_user["id"],
-        'caught_at': {
-            '$gte': start_date.isoformat(),
-            '$lt': end_date.isoformat()
-        }
-    }, {"_id": 0}).to_list(10000)
+    catches = await storage.catches.list_for_user(user_id, start_date, end_date, limit=10000)
     
     for catch in catches:
         if isinstance(catch['caught_at'], str):
@@ -387,10 +662,19 @@ async def get_monthly_stats(year: int, current_user: dict = Depends(get_current_
     
     return stats
 
-@api_router.get("/stats/yearly", response_model=List[YearlyStats])
-async def get_yearly_stats(current_user: dict = Depends(get_current_user)):
-    """Get yearly statistics for user"""
-    catches = await db.catches.find({"user_id": current_user["id"]}, {"_id": 0}).to_list(10000)
+@api_router.get("/stats/monthly", response_model=List[MonthlyStats])
+async def get_monthly_stats(
+    year: int,
+    current_user: dict = Depends(get_current_user),
+    storage: Storage = Depends(get_storage)
+):
+    """Get monthly statistics for user"""
+    user_id = current_user["id"]
+    key = ("stats/monthly", user_id, year, catches_version(user_id))
+    return await coalesce.stats_flight.do(key, lambda: compute_monthly_stats(storage, user_id, year))
+
+async def compute_yearly_stats(storage: Storage, user_id: str) -> List[YearlyStats]:
+    catches = await storage.catches.list_for_user(user_id, limit=10000)
     
     for catch in catches:
         if isinstance(catch['caught_at'], str):
@@ -433,6 +717,60 @@ async def get_yearly_stats(current_user: dict = Depends(get_current_user)):
     
     return stats
 
+@api_router.get("/stats/yearly", response_model=List[YearlyStats])
+async def get_yearly_stats(current_user: dict = Depends(get_current_user), storage: Storage = Depends(get_storage)):
+    """Get yearly statistics for user"""
+    user_id = current_user["id"]
+    key = ("stats/yearly", user_id, catches_version(user_id))
+    return await coalesce.stats_flight.do(key, lambda: compute_yearly_stats(storage, user_id))
+
+async def compute_environment_stats(storage: Storage, user_id: str) -> EnvironmentStats:
+    catches = await storage.catches.list_with_environment(user_id)
+    
+    def summarize(group_catches):
+        weighted = [c['weight'] for c in group_catches if c.get('weight') and c['weight'] > 0]
+        total_weight = sum(weighted)
+        return {
+            'total_count': len(group_catches),
+            'total_weight': round(total_weight, 2),
+            'average_weight': round(total_weight / len(weighted), 2) if weighted else 0.0
+        }
+    
+    phase_data = defaultdict(list)
+    dawn_data = defaultdict(list)
+    for catch in catches:
+        env = catch['environment']
+        phase_data[env['moon_phase']].append(catch)
+        minutes = env.get('minutes_from_sunrise')
+        if minutes is not None and -DAWN_WINDOW_RANGE_MINUTES <= minutes < DAWN_WINDOW_RANGE_MINUTES:
+            window_start = (minutes // DAWN_WINDOW_MINUTES) * DAWN_WINDOW_MINUTES
+            dawn_data[window_start].append(catch)
+    
+    moon_phases = [
+        MoonPhaseStats(moon_phase=phase, **summarize(phase_data.get(phase, [])))
+        for phase in astro.MOON_PHASES
+    ]
+    dawn_windows = [
+        DawnWindowStats(
+            minutes_from=start,
+            minutes_to=start + DAWN_WINDOW_MINUTES,
+            **summarize(dawn_data.get(start, []))
+        )
+        for start in range(-DAWN_WINDOW_RANGE_MINUTES, DAWN_WINDOW_RANGE_MINUTES, DAWN_WINDOW_MINUTES)
+    ]
+    
+    return EnvironmentStats(moon_phases=moon_phases, dawn_windows=dawn_windows)
+
+@api_router.get("/stats/environment", response_model=EnvironmentStats)
+async def get_environment_stats(
+    current_user: dict = Depends(get_current_user),
+    storage: Storage = Depends(get_storage)
+):
+    """Get catch statistics by moon phase and by time relative to sunrise"""
+    user_id = current_user["id"]
+    key = ("stats/environment", user_id, catches_version(user_id))
+    return await coalesce.stats_flight.do(key, lambda: compute_environment_stats(storage, user_id))
+
 # Analytics Models
 class AnalyticsEvent(BaseModel):
     event_type: str  # 'visit', 'install', 'page_view', 'catch_logged'
@@ -450,69 +788,108 @@ class AnalyticsResponse(BaseModel):
     daily_visits: list
 
 # Analytics Routes
-@api_router.post("/analytics/track")
-async def track_event(event: AnalyticsEvent):
+@api_router.post(
+    "/analytics/track",
+    dependencies=[Depends(ratelimit.admission.shed_low_priority), Depends(limit_track_by_ip)]
+)
+async def track_event(event: AnalyticsEvent, storage: Storage = Depends(get_storage)):
     """Track an analytics event"""
     visitor_id = str(uuid.uuid4())  # In real app, would use cookie/fingerprint
     
-    doc = {
-        "event_type": event.event_type,
-        "page": event.page,
-        "device_type": event.device_type,
-        "user_agent": event.user_agent,
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "visitor_id": visitor_id
-    }
+    doc = analytics_store.build_event(
+        event_type=event.event_type,
+        page=event.page,
+        device_type=event.device_type,
+        user_agent=event.user_agent,
+        visitor_id=visitor_id
+    )
     
-    await db.analytics.insert_one(doc)
+    await storage.analytics.record(doc)
     return {"status": "tracked"}
 
-@api_router.get("/analytics/stats", response_model=AnalyticsResponse)
-async def get_analytics_stats(current_user: dict = Depends(get_current_user)):
-    """Get analytics statistics (admin only for now)"""
-    
-    # Get all analytics events
-    events = await db.analytics.find({}, {"_id": 0}).to_list(100000)
-    
-    total_visits = len([e for e in events if e.get('event_type') == 'visit'])
-    unique_visitors = len(set([e.get('visitor_id') for e in events if e.get('visitor_id')]))
-    total_installs = len([e for e in events if e.get('event_type') == 'install'])
-    catches_logged = len([e for e in events if e.get('event_type') == 'catch_logged'])
+async def compute_analytics_stats(storage: Storage) -> AnalyticsResponse:
+    # One summary per day: compacted history plus live raw events
+    summaries = await storage.analytics.daily_summaries()
+    unique_visitors = await storage.analytics.count_unique_visitors()
     
-    # Page views breakdown
+    event_totals = defaultdict(int)
     page_views = {}
-    for e in events:
-        if e.get('event_type') == 'page_view' and e.get('page'):
-            page = e['page']
-            page_views[page] = page_views.get(page, 0) + 1
-    
-    # Device breakdown
     device_breakdown = {}
-    for e in events:
-        device = e.get('device_type', 'unknown')
-        device_breakdown[device] = device_breakdown.get(device, 0) + 1
+    visits_by_day = defaultdict(int)
+    
+    for summary in summaries:
+        for row in summary.get('counts', []):
+            event_type = row.get('event_type')
+            count = row['count']
+            event_totals[event_type] += count
+            
+            # Page views breakdown
+            if event_type == 'page_view' and row.get('page'):
+                page_views[row['page']] = page_views.get(row['page'], 0) + count
+            
+            # Device breakdown
+            device = row.get('device_type') or 'unknown'
+            device_breakdown[device] = device_breakdown.get(device, 0) + count
+            
+            if event_type == 'visit':
+                visits_by_day[summary['day']] += count
     
     # Daily visits (last 30 days)
     daily_visits = []
     today = datetime.now(timezone.utc).date()
     for i in range(30):
-        day = today - timedelta(days=i)
-        day_str = day.isoformat()
-        count = len([e for e in events if e.get('timestamp', '').startswith(day_str) and e.get('event_type') == 'visit'])
-        daily_visits.append({"date": day_str, "visits": count})
+        day_str = (today - timedelta(days=i)).isoformat()
+        daily_visits.append({"date": day_str, "visits": visits_by_day.get(day_str, 0)})
     
     daily_visits.reverse()
     
     return AnalyticsResponse(
-        total_visits=total_visits,
+        total_visits=event_totals['visit'],
         unique_visitors=unique_visitors,
-        total_installs=total_installs,
-        catches_logged=catches_logged,
+        total_installs=event_totals['install'],
+        catches_logged=event_totals['catch_logged'],
         page_views=page_views,
         device_breakdown=device_breakdown,
         daily_visits=daily_visits
     )
 
+@api_router.get("/analytics/stats", response_model=AnalyticsResponse)
+async def get_analytics_stats(current_user: dict = Depends(get_current_user), storage: Storage = Depends(get_storage)):
+    """Get analytics statistics (admin only for now)"""
+    # Not versioned: tracking writes constantly, so rely on the short TTL
+    return await coalesce.stats_flight.do(("analytics/stats",), lambda: compute_analytics_stats(storage))
+
+# Job Routes
+@api_router.get("/jobs/stats")
+async def get_job_stats(current_user: dict = Depends(get_current_user), storage: Storage = Depends(get_storage)):
+    """Get job counts by status (admin only for now)"""
+    return await storage.jobs.count_by_status()
+
+@api_router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job_status(
+    job_id: str,
+    current_user: dict = Depends(get_current_user),
+    storage: Storage = Depends(get_storage)
+):
+    """Get the status of one of the user's background jobs"""
+    job = await storage.jobs.get(job_id)
+    if job is None or job.get('user_id') != current_user["id"]:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Metrics Routes
+@api_router.get("/metrics")
+async def get_metrics(current_user: dict = Depends(get_current_user)):
+    """Get in-process load, rate limiting and request coalescing metrics (admin only for now)"""
+    return {
+        "coalescing": coalesce.stats_flight.stats(),
+        "admission": ratelimit.admission.stats(),
+        "rate_limited": {
+            limiter.name: limiter.rejected
+            for limiter in (limit_login_by_ip.limiter, limit_track_by_ip.limiter, login_user_limiter)
+        }
+    }
+
 # Include the router
 app.include_router(api_router)
 
@@ -528,8 +905,3 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
@@ -0,0 +1,137 @@
+"""Storage interface: repositories for users, catches, analytics and jobs.
+
+Routes and workers talk to a `Storage` instead of Motor collections, so the
+backend can be swapped. Selected with STORAGE_BACKEND:
+
+    mongo   (default) MongoDB via Motor, see storage_mongo.py
+    memory  in-process indexed dicts, see storage_memory.py; no database
+            needed, for tests and CPU-only benchmarks
+
+Documents keep the stored layout used throughout the app: dicts with string
+ids and ISO-format `caught_at`/`created_at` strings, never a Mongo `_id`.
+Every implementation must pass tests/test_storage_contract.py.
+"""
+import os
+from abc import ABC, abstractmethod
+from datetime import date, datetime
+from typing import Dict, List, Optional
+
+# Marker returned by CatchRepository.insert_many for idempotency-key clashes
+DUPLICATE = "duplicate"
+
+
+class UserRepository(ABC):
+    @abstractmethod
+    async def get_by_id(self, user_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def get_by_email(self, email: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def create(self, doc: dict) -> None: ...
+
+    @abstractmethod
+    async def update_profile(self, user_id: str, profile: dict) -> Optional[dict]:
+        """Replace the profile and return the updated user"""
+
+
+class CatchRepository(ABC):
+    @abstractmethod
+    async def insert(self, doc: dict) -> None: ...
+
+    @abstractmethod
+    async def insert_many(self, docs: List[dict]) -> Dict[int, str]:
+        """Insert all docs that can be written; return failures as {index: DUPLICATE or error}"""
+
+    @abstractmethod
+    async def find_by_idempotency_keys(self, user_id: str, keys: List[str]) -> List[dict]: ...
+
+    @abstractmethod
+    async def list_for_user(self, user_id: str, start: Optional[datetime] = None,
+                            end: Optional[datetime] = None, limit: Optional[int] = None,
+                            newest_first: bool = False) -> List[dict]:
+        """Catches with start <= caught_at < end, optionally newest first and limited"""
+
+    @abstractmethod
+    async def get(self, user_id: str, catch_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def delete(self, user_id: str, catch_id: str) -> Optional[dict]:
+        """Delete a user's catch; return the deleted document, or None if not found"""
+
+    @abstractmethod
+    async def set_photo(self, user_id: str, catch_id: str, fields: dict) -> Optional[dict]:
+        """Set photo fields on a user's catch; return the updated catch"""
+
+    @abstractmethod
+    async def list_with_environment(self, user_id: str) -> List[dict]: ...
+
+    @abstractmethod
+    async def list_missing_environment(self, user_id: str) -> List[dict]: ...
+
+    @abstractmethod
+    async def set_environments(self, environments: Dict[str, dict]) -> int:
+        """Set `environment` on catches by id; return the number updated"""
+
+
+class AnalyticsRepository(ABC):
+    @abstractmethod
+    async def record(self, event: dict) -> None: ...
+
+    @abstractmethod
+    async def compact(self, until: Optional[date] = None) -> int:
+        """Summarize completed days before `until` (default today); return days written"""
+
+    @abstractmethod
+    async def daily_summaries(self) -> List[dict]:
+        """Per-day summaries covering all history: compacted days plus live raw events"""
+
+    @abstractmethod
+    async def count_unique_visitors(self) -> int:
+        """Distinct visitor ids across all recorded events"""
+
+
+class JobRepository(ABC):
+    @abstractmethod
+    async def insert_many(self, jobs: List[dict]) -> None: ...
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[dict]: ...
+
+    @abstractmethod
+    async def count_by_status(self) -> Dict[str, int]: ...
+
+    @abstractmethod
+    async def claim(self, job_types: List[str], worker_id: str, visibility_timeout: float) -> Optional[dict]:
+        """Atomically take the next due job, or one whose lock has expired"""
+
+    @abstractmethod
+    async def extend_lock(self, job: dict, visibility_timeout: float) -> None: ...
+
+    @abstractmethod
+    async def finish(self, job: dict, fields: dict) -> None:
+        """Record the outcome, unless another worker has taken the job since"""
+
+
+class Storage(ABC):
+    users: UserRepository
+    catches: CatchRepository
+    analytics: AnalyticsRepository
+    jobs: JobRepository
+
+    async def init(self) -> None:
+        """Create indexes/collections; called once at startup"""
+
+    async def close(self) -> None:
+        pass
+
+
+def create_storage(backend: Optional[str] = None) -> Storage:
+    backend = backend or os.environ.get('STORAGE_BACKEND', 'mongo')
+    if backend == "memory":
+        from storage_memory import MemoryStorage
+        return MemoryStorage()
+    if backend == "mongo":
+        from storage_mongo import MongoStorage
+        return MongoStorage(os.environ['MONGO_URL'], os.environ['DB_NAME'])
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
@@ -0,0 +1,262 @@
+"""In-memory implementation of the storage interface.
+
+Documents live in dicts keyed by id, with secondary indexes for the lookups
+the routes make (user email, per-user catches, idempotency keys). Nothing is
+persisted; intended for tests, local runs and deterministic benchmarks.
+Returned documents are copies, as with a real database.
+"""
+import copy
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone, timedelta, date
+from typing import Dict, List, Optional
+
+import analytics_store
+import jobs
+from storage import (
+    AnalyticsRepository, CatchRepository, DUPLICATE, JobRepository, Storage, UserRepository,
+)
+
+
+class MemoryUserRepository(UserRepository):
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+        self.id_by_email: Dict[str, str] = {}
+
+    async def get_by_id(self, user_id: str) -> Optional[dict]:
+        return copy.deepcopy(self.by_id.get(user_id))
+
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        user_id = self.id_by_email.get(email)
+        return copy.deepcopy(self.by_id.get(user_id)) if user_id else None
+
+    async def create(self, doc: dict) -> None:
+        self.by_id[doc["id"]] = copy.deepcopy(doc)
+        self.id_by_email[doc["email"]] = doc["id"]
+
+    async def update_profile(self, user_id: str, profile: dict) -> Optional[dict]:
+        user = self.by_id.get(user_id)
+        if user is None:
+            return None
+        user["profile"] = copy.deepcopy(profile)
+        return copy.deepcopy(user)
+
+
+class MemoryCatchRepository(CatchRepository):
+    def __init__(self):
+        self.by_id: Dict[str, dict] = {}
+        self.ids_by_user: Dict[str, set] = defaultdict(set)
+        self.id_by_idempotency_key: Dict[tuple, str] = {}
+
+    def _user_catches(self, user_id: str) -> List[dict]:
+        return [self.by_id[catch_id] for catch_id in self.ids_by_user.get(user_id, ())]
+
+    async def insert(self, doc: dict) -> None:
+        error = self._insert(doc)
+        if error:
+            raise ValueError(error)
+
+    def _insert(self, doc: dict) -> Optional[str]:
+        key = doc.get("idempotency_key")
+        if isinstance(key, str) and (doc["user_id"], key) in self.id_by_idempotency_key:
+            return DUPLICATE
+        self.by_id[doc["id"]] = copy.deepcopy(doc)
+        self.ids_by_user[doc["user_id"]].add(doc["id"])
+        if isinstance(key, str):
+            self.id_by_idempotency_key[(doc["user_id"], key)] = doc["id"]
+        return None
+
+    async def insert_many(self, docs: List[dict]) -> Dict[int, str]:
+        failed = {}
+        for i, doc in enumerate(docs):
+            error = self._insert(doc)
+            if error:
+                failed[i] = error
+        return failed
+
+    async def find_by_idempotency_keys(self, user_id: str, keys: List[str]) -> List[dict]:
+        ids = [self.id_by_idempotency_key.get((user_id, key)) for key in keys]
+        return [copy.deepcopy(self.by_id[catch_id]) for catch_id in ids if catch_id]
+
+    async def list_for_user(self, user_id: str, start: Optional[datetime] = None,
+                            end: Optional[datetime] = None, limit: Optional[int] = None,
+                            newest_first: bool = False) -> List[dict]:
+        # Compare ISO strings, matching how the Mongo implementation queries
+        start_str = start.isoformat() if start else None
+        end_str = end.isoformat() if end else None
+        catches = [
+            c for c in self._user_catches(user_id)
+            if (start_str is None or c["caught_at"] >= start_str)
+            and (end_str is None or c["caught_at"] < end_str)
+        ]
+        if newest_first:
+            catches.sort(key=lambda c: c["caught_at"], reverse=True)
+        if limit:
+            catches = catches[:limit]
+        return copy.deepcopy(catches)
+
+    def _owned(self, user_id: str, catch_id: str) -> Optional[dict]:
+        catch = self.by_id.get(catch_id)
+        return catch if catch is not None and catch["user_id"] == user_id else None
+
+    async def get(self, user_id: str, catch_id: str) -> Optional[dict]:
+        return copy.deepcopy(self._owned(user_id, catch_id))
+
+    async def delete(self, user_id: str, catch_id: str) -> Optional[dict]:
+        catch = self._owned(user_id, catch_id)
+        if catch is None:
+            return None
+        del self.by_id[catch_id]
+        self.ids_by_user[user_id].discard(catch_id)
+        key = catch.get("idempotency_key")
+        if isinstance(key, str):
+            self.id_by_idempotency_key.pop((user_id, key), None)
+        return catch
+
+    async def set_photo(self, user_id: str, catch_id: str, fields: dict) -> Optional[dict]:
+        catch = self._owned(user_id, catch_id)
+        if catch is None:
+            return None
+        catch.update(copy.deepcopy(fields))
+        return copy.deepcopy(catch)
+
+    async def list_with_environment(self, user_id: str) -> List[dict]:
+        return [
+            {"id": c["id"], "weight": c.get("weight"), "environment": copy.deepcopy(c["environment"])}
+            for c in self._user_catches(user_id) if c.get("environment") is not None
+        ]
+
+    async def list_missing_environment(self, user_id: str) -> List[dict]:
+        return [
+            {"id": c["id"], "caught_at": c["caught_at"], "latitude": c.get("latitude"), "longitude": c.get("longitude")}
+            for c in self._user_catches(user_id) if c.get("environment") is None
+        ]
+
+    async def set_environments(self, environments: Dict[str, dict]) -> int:
+        updated = 0
+        for catch_id, env in environments.items():
+            catch = self.by_id.get(catch_id)
+            if catch is not None:
+                catch["environment"] = copy.deepcopy(env)
+                updated += 1
+        return updated
+
+
+class MemoryAnalyticsRepository(AnalyticsRepository):
+    def __init__(self, retention_days: int = analytics_store.ANALYTICS_RETENTION_DAYS):
+        self.retention_days = retention_days
+        self.events: List[dict] = []
+        self.daily: Dict[str, dict] = {}
+        self.visitors: Dict[str, datetime] = {}
+
+    async def record(self, event: dict) -> None:
+        self.events.append(copy.deepcopy(event))
+        visitor_id = event.get("visitor_id")
+        if visitor_id:
+            seen = self.visitors.get(visitor_id)
+            self.visitors[visitor_id] = min(seen, event["timestamp"]) if seen else event["timestamp"]
+
+    async def compact(self, until: Optional[date] = None) -> int:
+        until = until or datetime.now(timezone.utc).date()
+        if self.daily:
+            start_day = date.fromisoformat(max(self.daily)) + timedelta(days=1)
+        elif self.events:
+            start_day = min(e["timestamp"] for e in self.events).date()
+        else:
+            return 0
+        if start_day >= until:
+            return 0
+
+        pending = [e for e in self.events if start_day <= e["timestamp"].date() < until]
+        summaries = analytics_store.summarize_events(pending)
+        day = start_day
+        while day < until:
+            self.daily[day.isoformat()] = summaries.get(
+                day.isoformat(), {"day": day.isoformat(), "counts": [], "unique_visitors": 0}
+            )
+            day += timedelta(days=1)
+
+        # Equivalent of the time-series TTL
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        self.events = [e for e in self.events if e["timestamp"] >= cutoff]
+        return len(summaries)
+
+    async def daily_summaries(self) -> List[dict]:
+        last = max(self.daily) if self.daily else None
+        live = [e for e in self.events if last is None or e["timestamp"].date().isoformat() > last]
+        return copy.deepcopy(list(self.daily.values())) + list(analytics_store.summarize_events(live).values())
+
+    async def count_unique_visitors(self) -> int:
+        return len(self.visitors)
+
+
+class MemoryJobRepository(JobRepository):
+    def __init__(self, retention_days: float = jobs.JOB_RETENTION_DAYS):
+        self.retention_days = retention_days
+        self.by_id: Dict[str, dict] = {}
+
+    def _expire_finished(self):
+        """Equivalent of the TTL index on finished_at"""
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        expired = [job_id for job_id, job in self.by_id.items()
+                   if job.get("finished_at") is not None and job["finished_at"] < cutoff]
+        for job_id in expired:
+            del self.by_id[job_id]
+
+    async def insert_many(self, jobs: List[dict]) -> None:
+        self._expire_finished()
+        for job in jobs:
+            self.by_id[job["id"]] = copy.deepcopy(job)
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        job = copy.deepcopy(self.by_id.get(job_id))
+        if job:
+            job.pop("lock_token", None)
+        return job
+
+    async def count_by_status(self) -> Dict[str, int]:
+        counts = defaultdict(int)
+        for job in self.by_id.values():
+            counts[job["status"]] += 1
+        return dict(counts)
+
+    async def claim(self, job_types: List[str], worker_id: str, visibility_timeout: float) -> Optional[dict]:
+        self._expire_finished()
+        now = datetime.now(timezone.utc)
+        due = [
+            job for job in self.by_id.values()
+            if job["type"] in job_types and (
+                (job["status"] == "queued" and job["run_at"] <= now)
+                or (job["status"] == "running" and job["locked_until"] < now)
+            )
+        ]
+        if not due:
+            return None
+        job = min(due, key=lambda j: j["run_at"])
+        job.update(
+            status="running",
+            locked_until=now + timedelta(seconds=visibility_timeout),
+            lock_token=uuid.uuid4().hex,
+            worker_id=worker_id,
+            updated_at=now,
+            attempts=job["attempts"] + 1,
+        )
+        return copy.deepcopy(job)
+
+    async def extend_lock(self, job: dict, visibility_timeout: float) -> None:
+        stored = self.by_id.get(job["id"])
+        if stored and stored["lock_token"] == job["lock_token"]:
+            stored["locked_until"] = datetime.now(timezone.utc) + timedelta(seconds=visibility_timeout)
+
+    async def finish(self, job: dict, fields: dict) -> None:
+        stored = self.by_id.get(job["id"])
+        if stored and stored["lock_token"] == job["lock_token"]:
+            stored.update(copy.deepcopy(fields))
+
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        self.users = MemoryUserRepository()
+        self.catches = MemoryCatchRepository()
+        self.analytics = MemoryAnalyticsRepository()
+        self.jobs = MemoryJobRepository()
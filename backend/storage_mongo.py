@@ -0,0 +1,234 @@
+"""MongoDB (Motor) implementation of the storage interface"""
+import uuid
+from datetime import datetime, timezone, timedelta, date
+from typing import Dict, List, Optional
+
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+import analytics_store
+import jobs
+from storage import (
+    AnalyticsRepository, CatchRepository, DUPLICATE, JobRepository, Storage, UserRepository,
+)
+
+JOBS_COLLECTION = "jobs"
+
+
+def _date_range(start: Optional[datetime], end: Optional[datetime]) -> dict:
+    # caught_at is stored as an ISO string, so ranges compare ISO strings
+    query = {}
+    if start:
+        query['$gte'] = start.isoformat()
+    if end:
+        query['$lt'] = end.isoformat()
+    return query
+
+
+class MongoUserRepository(UserRepository):
+    def __init__(self, db):
+        self.collection = db.users
+
+    async def get_by_id(self, user_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": user_id}, {"_id": 0})
+
+    async def get_by_email(self, email: str) -> Optional[dict]:
+        return await self.collection.find_one({"email": email}, {"_id": 0})
+
+    async def create(self, doc: dict) -> None:
+        await self.collection.insert_one(dict(doc))
+
+    async def update_profile(self, user_id: str, profile: dict) -> Optional[dict]:
+        return await self.collection.find_one_and_update(
+            {"id": user_id},
+            {"$set": {"profile": profile}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+
+class MongoCatchRepository(CatchRepository):
+    def __init__(self, db):
+        self.collection = db.catches
+
+    async def insert(self, doc: dict) -> None:
+        await self.collection.insert_one(dict(doc))
+
+    async def insert_many(self, docs: List[dict]) -> Dict[int, str]:
+        # Unordered: one round trip, and a duplicate key on one item does not
+        # stop the others from being written
+        failed = {}
+        try:
+            await self.collection.insert_many([dict(doc) for doc in docs], ordered=False)
+        except BulkWriteError as e:
+            for write_error in e.details.get('writeErrors', []):
+                failed[write_error['index']] = (
+                    DUPLICATE if write_error.get('code') == 11000 else write_error.get('errmsg', 'write failed')
+                )
+        return failed
+
+    async def find_by_idempotency_keys(self, user_id: str, keys: List[str]) -> List[dict]:
+        return await self.collection.find(
+            {"user_id": user_id, "idempotency_key": {"$in": keys}}, {"_id": 0}
+        ).to_list(len(keys))
+
+    async def list_for_user(self, user_id: str, start: Optional[datetime] = None,
+                            end: Optional[datetime] = None, limit: Optional[int] = None,
+                            newest_first: bool = False) -> List[dict]:
+        query = {"user_id": user_id}
+        if start or end:
+            query['caught_at'] = _date_range(start, end)
+        cursor = self.collection.find(query, {"_id": 0})
+        if newest_first:
+            cursor = cursor.sort('caught_at', -1)
+        return await cursor.to_list(limit)
+
+    async def get(self, user_id: str, catch_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": catch_id, "user_id": user_id}, {"_id": 0})
+
+    async def delete(self, user_id: str, catch_id: str) -> Optional[dict]:
+        return await self.collection.find_one_and_delete(
+            {"id": catch_id, "user_id": user_id}, projection={"_id": 0}
+        )
+
+    async def set_photo(self, user_id: str, catch_id: str, fields: dict) -> Optional[dict]:
+        return await self.collection.find_one_and_update(
+            {"id": catch_id, "user_id": user_id},
+            {"$set": fields},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def list_with_environment(self, user_id: str) -> List[dict]:
+        return await self.collection.find(
+            {"user_id": user_id, "environment": {"$ne": None}},
+            {"_id": 0, "id": 1, "weight": 1, "environment": 1}
+        ).to_list(None)
+
+    async def list_missing_environment(self, user_id: str) -> List[dict]:
+        return await self.collection.find(
+            {"user_id": user_id, "environment": None},
+            {"_id": 0, "id": 1, "caught_at": 1, "latitude": 1, "longitude": 1}
+        ).to_list(None)
+
+    async def set_environments(self, environments: Dict[str, dict]) -> int:
+        updated = 0
+        updates = [UpdateOne({"id": catch_id}, {"$set": {"environment": env}})
+                   for catch_id, env in environments.items()]
+        for i in range(0, len(updates), 500):
+            updated += (await self.collection.bulk_write(updates[i:i + 500], ordered=False)).modified_count
+        return updated
+
+
+class MongoAnalyticsRepository(AnalyticsRepository):
+    def __init__(self, db):
+        self.db = db
+
+    async def record(self, event: dict) -> None:
+        await analytics_store.record_event(self.db, dict(event))
+
+    async def compact(self, until: Optional[date] = None) -> int:
+        return await analytics_store.compact_daily_summaries(self.db, until)
+
+    async def daily_summaries(self) -> List[dict]:
+        return await analytics_store.load_daily_summaries(self.db)
+
+    async def count_unique_visitors(self) -> int:
+        return await analytics_store.count_unique_visitors(self.db)
+
+
+class MongoJobRepository(JobRepository):
+    def __init__(self, db):
+        self.collection = db[JOBS_COLLECTION]
+
+    async def insert_many(self, jobs: List[dict]) -> None:
+        await self.collection.insert_many([dict(job) for job in jobs])
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"id": job_id}, {"_id": 0, "lock_token": 0})
+
+    async def count_by_status(self) -> Dict[str, int]:
+        counts = self.collection.aggregate([{"$group": {"_id": "$status", "count": {"$sum": 1}}}])
+        return {row["_id"]: row["count"] async for row in counts}
+
+    async def claim(self, job_types: List[str], worker_id: str, visibility_timeout: float) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await self.collection.find_one_and_update(
+            {
+                "type": {"$in": job_types},
+                "$or": [
+                    {"status": "queued", "run_at": {"$lte": now}},
+                    {"status": "running", "locked_until": {"$lt": now}},
+                ],
+            },
+            {
+                "$set": {
+                    "status": "running",
+                    "locked_until": now + timedelta(seconds=visibility_timeout),
+                    "lock_token": uuid.uuid4().hex,
+                    "worker_id": worker_id,
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("run_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def extend_lock(self, job: dict, visibility_timeout: float) -> None:
+        await self.collection.update_one(
+            {"id": job["id"], "lock_token": job["lock_token"]},
+            {"$set": {"locked_until": datetime.now(timezone.utc) + timedelta(seconds=visibility_timeout)}},
+        )
+
+    async def finish(self, job: dict, fields: dict) -> None:
+        await self.collection.update_one(
+            {"id": job["id"], "lock_token": job["lock_token"]},
+            {"$set": fields},
+        )
+
+
+class MongoStorage(Storage):
+    def __init__(self, mongo_url: str, db_name: str):
+        self.client = AsyncIOMotorClient(mongo_url)
+        self.db = self.client[db_name]
+        self.users = MongoUserRepository(self.db)
+        self.catches = MongoCatchRepository(self.db)
+        self.analytics = MongoAnalyticsRepository(self.db)
+        self.jobs = MongoJobRepository(self.db)
+
+    async def init(self) -> None:
+        await self.db.users.create_index("id")
+        await self.db.users.create_index("email")
+        await self.db.catches.create_index("id")
+        await self.db.catches.create_index([("user_id", 1), ("caught_at", -1)])
+        # Dedupe offline-queued catches on their client-generated key; catches
+        # logged through the single-item endpoint have no key and are not indexed
+        await self.db.catches.create_index(
+            [("user_id", 1), ("idempotency_key", 1)],
+            unique=True,
+            partialFilterExpression={"idempotency_key": {"$type": "string"}},
+            name="user_idempotency_key_unique"
+        )
+
+        # Raw analytics events: time-series collection with TTL, compacted daily
+        await analytics_store.ensure_collections(self.db)
+
+        await self.db[JOBS_COLLECTION].create_index("id", unique=True)
+        await self.db[JOBS_COLLECTION].create_index([("status", 1), ("run_at", 1)])
+        await self.db[JOBS_COLLECTION].create_index([("status", 1), ("locked_until", 1)])
+        # Only finished jobs have finished_at, so queued and running jobs never expire
+        expire_after = int(jobs.JOB_RETENTION_DAYS * 24 * 60 * 60)
+        try:
+            await self.db[JOBS_COLLECTION].create_index(
+                "finished_at", expireAfterSeconds=expire_after, name="finished_at_ttl"
+            )
+        except OperationFailure:
+            # Index exists with a different retention
+            await self.db.command("collMod", JOBS_COLLECTION,
+                                  index={"name": "finished_at_ttl", "expireAfterSeconds": expire_after})
+
+    async def close(self) -> None:
+        self.client.close()
@@ -2,6 +2,9 @@ import requests
 import sys
 import json
 import base64
+import struct
+import uuid
+import zlib
 from datetime import datetime
 from typing import Dict, Any
 
@@ -133,6 +136,53 @@ class CarplogAPITester:
             print(f"   Created catch with ID: {response['id']}")
         return success, response
 
+    def test_create_catches_batch(self):
+        """Test batched catch upload and that a retried batch is deduplicated"""
+        batch = [
+            {"idempotency_key": str(uuid.uuid4()), "fish_name": "Queued Carp 1", "weight": 9.4, "bait_used": "Tigers"},
+            {"idempotency_key": str(uuid.uuid4()), "fish_name": "Queued Carp 2", "weight": 11.1, "bait_used": "Boilies"}
+        ]
+        success, response = self.run_test("Create Catches Batch", "POST", "catches/batch", 200, batch)
+        if not success:
+            return success, response
+        for result in response.get('results', []):
+            if result.get('status') == 'created' and result.get('catch'):
+                self.test_catches.append(result['catch']['id'])
+        self.log_test("Batch Items Created", response.get('created') == len(batch),
+                      f"created={response.get('created')}")
+
+        # Replaying the same queue must not create new catches
+        success, retry = self.run_test("Retry Catches Batch", "POST", "catches/batch", 200, batch)
+        if success:
+            self.log_test("Batch Retry Deduplicated", retry.get('duplicates') == len(batch) and retry.get('created') == 0,
+                          f"created={retry.get('created')} duplicates={retry.get('duplicates')}")
+        return success, retry
+
+    def test_upload_catch_photo(self, catch_id: str):
+        """Test multipart photo upload, the generated renditions and type sniffing"""
+        url = f"{self.api_url}/catches/{catch_id}/photo"
+        headers = {'Authorization': f'Bearer {self.token}'}
+        png_data = self.create_sample_photo_png()
+        try:
+            response = requests.post(url, files={'file': ('catch.png', png_data, 'image/png')},
+                                     headers=headers, timeout=30)
+            catch = response.json() if response.status_code == 200 else {}
+            success = self.log_test("Upload Catch Photo", bool(catch.get('photo_url') and catch.get('thumbnail_url')),
+                                    f"Status: {response.status_code}")
+            if success:
+                thumb = requests.get(f"{self.base_url}{catch['thumbnail_url']}", timeout=10)
+                self.log_test("Fetch Photo Thumbnail",
+                              thumb.status_code == 200 and thumb.headers.get('content-type') == 'image/jpeg',
+                              f"Status: {thumb.status_code}")
+
+            # The declared content type is ignored; the bytes are not an image
+            response = requests.post(url, files={'file': ('catch.png', b'not really a png file', 'image/png')},
+                                     headers=headers, timeout=10)
+            self.log_test("Reject Non-image Upload", response.status_code == 415, f"Status: {response.status_code}")
+            return success, catch
+        except Exception as e:
+            return self.log_test("Upload Catch Photo", False, f"Error: {str(e)}"), {}
+
     def test_get_catches(self):
         """Test getting all catches"""
         return self.run_test("Get All Catches", "GET", "catches", 200)
@@ -161,12 +211,45 @@ class CarplogAPITester:
         """Test getting yearly statistics"""
         return self.run_test("Yearly Stats", "GET", "stats/yearly", 200)
 
+    def test_rate_limiting_under_overload(self, burst: int = 150):
+        """Flood the unauthenticated analytics endpoint and check logged-in users stay served"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        url = f"{self.api_url}/analytics/track"
+        event = {"event_type": "page_view", "page": "overload-test", "device_type": "desktop"}
+
+        def fire(_):
+            try:
+                return requests.post(url, json=event, timeout=10).status_code
+            except Exception:
+                return None
+
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            codes = list(pool.map(fire, range(burst)))
+
+        limited = sum(1 for code in codes if code in (429, 503))
+        self.log_test("Analytics Flood Limited", limited > 0,
+                      f"{limited}/{burst} requests rejected with 429/503")
+
+        # Authenticated traffic is not limited and must still succeed
+        return self.run_test("Authenticated Request During Flood", "GET", "auth/me", 200)
+
     def create_sample_photo_base64(self):
         """Create a small sample image as base64"""
         # Create a minimal 1x1 pixel PNG image
         png_data = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x02\x00\x00\x00\x90wS\xde\x00\x00\x00\tpHYs\x00\x00\x0b\x13\x00\x00\x0b\x13\x01\x00\x9a\x9c\x18\x00\x00\x00\nIDATx\x9cc\xf8\x00\x00\x00\x01\x00\x01\x00\x00\x00\x00IEND\xaeB`\x82'
         return f"data:image/png;base64,{base64.b64encode(png_data).decode()}"
 
+    def create_sample_photo_png(self, width: int = 64, height: int = 48):
+        """Create a decodable solid-colour PNG for upload tests"""
+        def chunk(kind, data):
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+        rows = b"".join(b"\x00" + b"\x2e\x8b\x57" * width for _ in range(height))
+        return (b"\x89PNG\r\n\x1a\n"
+                + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+                + chunk(b"IDAT", zlib.compress(rows))
+                + chunk(b"IEND", b""))
+
     def run_comprehensive_tests(self):
         """Run all API tests"""
         print("🎣 Starting Carplog-Pro API Tests")
@@ -236,6 +319,13 @@ class CarplogAPITester:
             if success:
                 created_catches.append(response)
 
+        # Test 7b: Batched upload of an offline queue
+        self.test_create_catches_batch()
+
+        # Test 7c: Photo upload for a logged catch
+        if created_catches:
+            self.test_upload_catch_photo(created_catches[0]['id'])
+
         # Test 8: Get catches after creation
         success, updated_catches = self.test_get_catches()
         if success:
@@ -278,6 +368,10 @@ class CarplogAPITester:
         self.run_test("Unauthorized Access", "GET", "catches", 401)
         self.token = old_token
 
+        # Test 13: Rate limiting / load shedding under synthetic overload
+        print("\n🌊 Testing Overload Protection:")
+        self.test_rate_limiting_under_overload()
+
         # Cleanup remaining test catches
         print(f"\n🧹 Cleaning up {len(self.test_catches)} remaining test catches...")
         for catch_id in self.test_catches.copy():
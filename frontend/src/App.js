@@ -1,7 +1,7 @@
 import { useState, useEffect, useCallback } from 'react';
 import '@/App.css';
 import axios from 'axios';
-import { Plus, Fish, TrendingUp, Calendar, Weight, Award, Trash2, User, LogOut, LogIn, UserPlus, Save, ChevronDown, ChevronUp, BarChart3, Download, Smartphone, Monitor, Users } from 'lucide-react';
+import { Plus, Fish, TrendingUp, Calendar, Weight, Award, Trash2, User, LogOut, LogIn, UserPlus, Save, ChevronDown, ChevronUp, BarChart3, Download, Smartphone, Monitor, Users, Camera } from 'lucide-react';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
 const API = `${BACKEND_URL}/api`;
@@ -115,9 +115,11 @@ function App() {
     wraps_count: '',
     bait_used: '',
     notes: '',
-    photo_base64: '',
     catch_date: new Date().toISOString().split('T')[0]
   });
+  // Selected photo is uploaded as a file after the catch is created
+  const [photoFile, setPhotoFile] = useState(null);
+  const [photoPreview, setPhotoPreview] = useState('');
 
   // Check authentication on mount - also load remembered credentials
   useEffect(() => {
@@ -373,12 +375,43 @@ function App() {
 
   const handleImageUpload = (e) => {
     const file = e.target.files[0];
-    if (file) {
-      const reader = new FileReader();
-      reader.onloadend = () => {
-        setFormData({ ...formData, photo_base64: reader.result });
-      };
-      reader.readAsDataURL(file);
+    if (photoPreview) {
+      URL.revokeObjectURL(photoPreview);
+    }
+    setPhotoFile(file || null);
+    setPhotoPreview(file ? URL.createObjectURL(file) : '');
+  };
+
+  // Uploaded photos are served as a thumbnail and a display size; older catches still carry base64
+  const catchThumbnail = (catch_item) =>
+    catch_item.thumbnail_url ? `${BACKEND_URL}${catch_item.thumbnail_url}` : catch_item.photo_base64;
+  const catchPhoto = (catch_item) =>
+    catch_item.photo_url ? `${BACKEND_URL}${catch_item.photo_url}` : catch_item.photo_base64;
+
+  const uploadCatchPhoto = async (catchId, file) => {
+    const photoData = new FormData();
+    photoData.append('file', file);
+    await axios.post(`${API}/catches/${catchId}/photo`, photoData, {
+      headers: getAuthHeaders()
+    });
+  };
+
+  const photoErrorDetail = (error) => {
+    const detail = error.response?.data?.detail;
+    return typeof detail === 'string' ? `: ${detail}` : '';
+  };
+
+  // Attach or retry a photo on a catch that is already saved
+  const handleAddPhoto = async (catchId, e) => {
+    const file = e.target.files[0];
+    e.target.value = '';
+    if (!file) return;
+    try {
+      await uploadCatchPhoto(catchId, file);
+      await loadData();
+    } catch (error) {
+      console.error('Error uploading photo:', error);
+      alert(`Failed to upload photo${photoErrorDetail(error)}`);
     }
   };
 
@@ -411,12 +444,23 @@ function App() {
       delete submitData.weight_lb;
       delete submitData.weight_oz;
       
-      await axios.post(`${API}/catches`, submitData, {
+      const response = await axios.post(`${API}/catches`, submitData, {
         headers: getAuthHeaders()
       });
       
-      // Track catch logged
-      trackEvent('catch_logged');
+      // The catch is saved at this point; a failed photo upload must not make
+      // the user resubmit it (which would log a duplicate)
+      let photoError = null;
+      if (photoFile) {
+        try {
+          await uploadCatchPhoto(response.data.id, photoFile);
+        } catch (error) {
+          console.error('Error uploading photo:', error);
+          photoError = error;
+        }
+      }
+      
+      // catch_logged is recorded server-side by a background job
       
       setFormData({
         fish_name: '',
@@ -430,11 +474,18 @@ function App() {
         wraps_count: '',
         bait_used: '',
         notes: '',
-        photo_base64: '',
         catch_date: new Date().toISOString().split('T')[0]
       });
+      if (photoPreview) {
+        URL.revokeObjectURL(photoPreview);
+      }
+      setPhotoFile(null);
+      setPhotoPreview('');
       await loadData();
       setActiveTab('catches');
+      if (photoError) {
+        alert(`Catch saved, but the photo could not be uploaded${photoErrorDetail(photoError)}. Use "Add photo" on the catch to try again.`);
+      }
     } catch (error) {
       console.error('Error adding catch:', error);
       alert('Failed to add catch');
@@ -1356,12 +1407,13 @@ function App() {
                 <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 gap-4">
                   {getFilteredCatches().map((catch_item) => (
                     <div key={catch_item.id} className="bg-slate-900/50 border border-slate-700 rounded-lg overflow-hidden" data-testid="recent-catch-card">
-                      {catch_item.photo_base64 && (
+                      {catchThumbnail(catch_item) && (
                         <img 
-                          src={catch_item.photo_base64} 
+                          src={catchThumbnail(catch_item)} 
                           alt="Catch" 
+                          loading="lazy"
                           className="w-full h-48 object-cover cursor-pointer hover:opacity-90 transition-opacity" 
-                          onClick={() => setModalImage(catch_item.photo_base64)}
+                          onClick={() => setModalImage(catchPhoto(catch_item))}
                         />
                       )}
                       <div className="p-4">
@@ -1412,8 +1464,8 @@ function App() {
                   className="w-full bg-slate-900 border border-slate-700 rounded-lg px-4 py-2 text-slate-300"
                   data-testid="photo-input"
                 />
-                {formData.photo_base64 && (
-                  <img src={formData.photo_base64} alt="Preview" className="mt-2 max-h-48 rounded-lg" />
+                {photoPreview && (
+                  <img src={photoPreview} alt="Preview" className="mt-2 max-h-48 rounded-lg" />
                 )}
               </div>
 
@@ -1607,12 +1659,13 @@ function App() {
               <div className="grid grid-cols-1 md:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-4">
                 {catches.map((catch_item) => (
                   <div key={catch_item.id} className="bg-slate-800/50 backdrop-blur-sm border border-emerald-900/30 rounded-xl overflow-hidden" data-testid="catch-card">
-                    {catch_item.photo_base64 && (
+                    {catchThumbnail(catch_item) && (
                       <img 
-                        src={catch_item.photo_base64} 
+                        src={catchThumbnail(catch_item)} 
                         alt="Catch" 
+                        loading="lazy"
                         className="w-full h-48 object-cover cursor-pointer hover:opacity-90 transition-opacity" 
-                        onClick={() => setModalImage(catch_item.photo_base64)}
+                        onClick={() => setModalImage(catchPhoto(catch_item))}
                       />
                     )}
                     <div className="p-4">
@@ -1631,6 +1684,16 @@ function App() {
                         {catch_item.notes && <p className="text-slate-500 text-xs italic">{catch_item.notes}</p>}
                         <p className="text-slate-500 text-xs mt-2">{new Date(catch_item.caught_at).toLocaleString()}</p>
                       </div>
+                      {!catchThumbnail(catch_item) && (
+                        <label
+                          className="mt-3 w-full bg-slate-700/50 hover:bg-slate-700 text-slate-300 px-3 py-2 rounded-lg text-sm flex items-center justify-center space-x-2 transition-colors cursor-pointer"
+                          data-testid="add-photo-btn"
+                        >
+                          <Camera className="w-4 h-4" />
+                          <span>Add photo</span>
+                          <input type="file" accept="image/*" className="hidden" onChange={(e) => handleAddPhoto(catch_item.id, e)} />
+                        </label>
+                      )}
                       <button
                         onClick={() => handleDelete(catch_item.id)}
                         className="mt-3 w-full bg-red-900/50 hover:bg-red-800 text-red-300 px-3 py-2 rounded-lg text-sm flex items-center justify-center space-x-2 transition-colors"
@@ -0,0 +1,84 @@
+import asyncio
+import gzip
+import json
+from datetime import date, datetime, timezone
+
+import pytest
+
+import analytics_store
+
+
+def events_on(*days_and_ids):
+    return [
+        analytics_store.build_event("visit", "/", "mobile", None, visitor_id,
+                                    datetime(day.year, day.month, day.day, 12, tzinfo=timezone.utc))
+        for day, visitor_id in days_and_ids
+    ]
+
+
+async def aiter(items):
+    for item in items:
+        yield dict(item)
+
+
+def read_archive(out_dir, day):
+    with gzip.open(out_dir / f"analytics-{day.isoformat()}.ndjson.gz", "rt") as handle:
+        return [json.loads(line) for line in handle]
+
+
+def test_archives_are_written_per_day(tmp_path):
+    d1, d2 = date(2024, 3, 1), date(2024, 3, 2)
+    events = events_on((d1, "a"), (d1, "b"), (d2, "c"))
+
+    assert asyncio.run(analytics_store.write_daily_archives(aiter(events), tmp_path)) == 3
+    assert [e["visitor_id"] for e in read_archive(tmp_path, d1)] == ["a", "b"]
+    assert [e["visitor_id"] for e in read_archive(tmp_path, d2)] == ["c"]
+    assert analytics_store.last_archived_day(tmp_path) == d2
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_rerun_never_overwrites_an_archived_day(tmp_path):
+    d1, d2 = date(2024, 3, 1), date(2024, 3, 2)
+    asyncio.run(analytics_store.write_daily_archives(aiter(events_on((d1, "a"), (d1, "b"))), tmp_path))
+
+    # TTL has since expired part of d1; a rerun must keep the complete file
+    rerun = events_on((d1, "b"), (d2, "c"))
+    assert asyncio.run(analytics_store.write_daily_archives(aiter(rerun), tmp_path)) == 1
+    assert [e["visitor_id"] for e in read_archive(tmp_path, d1)] == ["a", "b"]
+    assert [e["visitor_id"] for e in read_archive(tmp_path, d2)] == ["c"]
+
+
+def test_interrupted_run_leaves_no_partial_day(tmp_path):
+    d1, d2 = date(2024, 3, 1), date(2024, 3, 2)
+
+    async def failing():
+        for event in events_on((d1, "a"), (d2, "b")):
+            yield event
+        raise ConnectionError("cursor lost")
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(analytics_store.write_daily_archives(failing(), tmp_path))
+    assert analytics_store.last_archived_day(tmp_path) == d1
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+
+def test_merge_summaries_adds_counts_for_matching_rows():
+    compacted = {"day": "2024-03-01", "unique_visitors": 2, "compacted_at": "x", "counts": [
+        {"event_type": "visit", "device_type": "mobile", "page": None, "count": 3},
+    ]}
+    legacy = {"day": "2024-03-01", "unique_visitors": 1, "counts": [
+        {"event_type": "visit", "device_type": "mobile", "page": None, "count": 2},
+        {"event_type": "install", "device_type": "desktop", "page": None, "count": 1},
+    ]}
+
+    merged = analytics_store.merge_summaries(compacted, legacy)
+    assert sorted((r["event_type"], r["count"]) for r in merged["counts"]) == [("install", 1), ("visit", 5)]
+    assert merged["unique_visitors"] == 3
+    assert merged["day"] == "2024-03-01"
+
+
+def test_device_type_from_user_agent():
+    assert analytics_store.device_type_from_user_agent("Mozilla/5.0 (Linux; Android 14; Pixel 8)") == "mobile"
+    assert analytics_store.device_type_from_user_agent("Mozilla/5.0 (Windows NT 10.0; Win64; x64)") == "desktop"
+    assert analytics_store.device_type_from_user_agent(None) is None
@@ -0,0 +1,51 @@
+from datetime import date, datetime, timedelta, timezone
+
+import astro
+
+
+def test_known_new_and_full_moons():
+    # 2024-01-11 11:57 UTC new moon, 2024-01-25 17:54 UTC full moon
+    new = astro.moon_for_day(date(2024, 1, 11))
+    assert new["moon_phase"] == "New Moon"
+    assert new["moon_illumination"] < 0.02
+
+    full = astro.moon_for_day(date(2024, 1, 25))
+    assert full["moon_phase"] == "Full Moon"
+    assert full["moon_illumination"] > 0.98
+
+    assert astro.moon_for_day(date(2024, 1, 18))["moon_phase"] == "First Quarter"
+
+
+def test_known_sunrise_and_sunset():
+    # London, summer solstice 2024: sunrise 03:43 UTC, sunset 20:21 UTC
+    sun = astro.sun_for_day(date(2024, 6, 21), 51.5, -0.1)
+    assert abs(sun["sunrise"] - datetime(2024, 6, 21, 3, 43, tzinfo=timezone.utc)) < timedelta(minutes=3)
+    assert abs(sun["sunset"] - datetime(2024, 6, 21, 20, 21, tzinfo=timezone.utc)) < timedelta(minutes=3)
+
+
+def test_polar_day_and_night_have_no_sun_times():
+    # Tromso: midnight sun in June, polar night in December
+    for day in (date(2024, 6, 21), date(2024, 12, 21)):
+        assert astro.sun_for_day(day, 69.6, 19.0) == {"sunrise": None, "sunset": None}
+
+    env = astro.environment_for(datetime(2024, 6, 21, 12, tzinfo=timezone.utc), 69.6, 19.0)
+    assert env["minutes_from_sunrise"] is None
+    assert env["moon_phase"] in astro.MOON_PHASES
+
+
+def test_result_does_not_depend_on_the_offset_sent():
+    utc = datetime(2024, 6, 1, 21, 30, tzinfo=timezone.utc)
+    local = datetime(2024, 6, 1, 23, 30, tzinfo=timezone(timedelta(hours=2)))
+    naive = datetime(2024, 6, 1, 21, 30)
+
+    expected = astro.environment_for(utc, 46.0, 15.0)
+    assert expected["sunrise"].date() == date(2024, 6, 1)
+    assert expected["minutes_from_sunrise"] > 0
+    assert astro.environment_for(local, 46.0, 15.0) == expected
+    assert astro.environment_for(naive, 46.0, 15.0) == expected
+
+
+def test_environment_without_coordinates_has_moon_only():
+    env = astro.environment_for(datetime(2024, 1, 25, 20, tzinfo=timezone.utc))
+    assert env["moon_phase"] == "Full Moon"
+    assert env["sunrise"] is None and env["minutes_from_sunset"] is None
@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from coalesce import SingleFlight
+
+
+def test_concurrent_identical_requests_share_one_computation():
+    flight = SingleFlight(ttl=5)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"total": 42}
+
+    async def main():
+        return await asyncio.gather(*(flight.do(("stats", "u1"), compute) for _ in range(10)))
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(r == {"total": 42} for r in results)
+    assert flight.stats()["coalesced"] == 9
+
+
+def test_cached_result_expires_after_ttl(clock):
+    flight = SingleFlight(ttl=5, clock=clock)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        assert await flight.do("k", compute) == 1
+        clock.now = 4.9
+        assert await flight.do("k", compute) == 1
+        clock.now = 5.1
+        assert await flight.do("k", compute) == 2
+
+    asyncio.run(main())
+    assert flight.stats()["cache_hits"] == 1
+
+
+def test_version_bump_changes_key():
+    flight = SingleFlight(ttl=60)
+
+    async def main():
+        first = await flight.do(("stats", flight.version("u1")), lambda: asyncio.sleep(0, "old"))
+        flight.bump("u1")
+        second = await flight.do(("stats", flight.version("u1")), lambda: asyncio.sleep(0, "new"))
+        return first, second
+
+    assert asyncio.run(main()) == ("old", "new")
+
+
+def test_failures_are_shared_but_not_cached():
+    flight = SingleFlight(ttl=60)
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("database down")
+
+    async def main():
+        results = await asyncio.gather(*(flight.do("k", failing) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results)
+        with pytest.raises(RuntimeError):
+            await flight.do("k", failing)
+
+    asyncio.run(main())
+    assert len(calls) == 2
+
+
+def test_cache_size_is_bounded():
+    flight = SingleFlight(ttl=60, max_entries=2)
+
+    async def main():
+        for key in ("a", "b", "c"):
+            await flight.do(key, lambda: asyncio.sleep(0, key))
+
+    asyncio.run(main())
+    assert flight.stats()["cached_entries"] == 2
+
+
+def test_reading_a_version_does_not_track_the_scope():
+    flight = SingleFlight(ttl=60)
+    for user_id in range(100):
+        assert flight.version(("catches", user_id)) == 0
+    assert flight._versions == {}
+
+    flight.bump(("catches", 1))
+    assert flight.version(("catches", 1)) == 1
+    assert len(flight._versions) == 1
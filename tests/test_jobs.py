@@ -0,0 +1,136 @@
+import asyncio
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+import jobs
+from storage import create_storage
+
+
+@pytest.fixture
+def flaky_handler():
+    """Register a handler that fails `failures` times before succeeding"""
+    state = {"failures": 0, "calls": 0}
+
+    @jobs.job_handler("flaky")
+    async def flaky(storage, payload):
+        state["calls"] += 1
+        if state["calls"] <= state["failures"]:
+            raise RuntimeError(f"failure {state['calls']}")
+        return {"calls": state["calls"]}
+
+    yield state
+    del jobs.HANDLERS["flaky"]
+
+
+async def claim_due(storage, worker, job_id):
+    # Skip the backoff delay so the retry is due now
+    storage.jobs.by_id[job_id]["run_at"] = datetime.now(timezone.utc)
+    return await worker.claim()
+
+
+def test_failed_job_is_retried_with_backoff_then_succeeds(flaky_handler, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_BACKOFF_BASE_SECONDS", 10)
+    flaky_handler["failures"] = 2
+    storage = create_storage("memory")
+    worker = jobs.JobWorker(storage)
+
+    async def main():
+        job_id = await jobs.enqueue(storage, "flaky", {}, max_attempts=3)
+
+        await worker.run_job(await worker.claim())
+        first = await storage.jobs.get(job_id)
+        assert first["status"] == "queued" and first["last_error"] == "failure 1"
+        delay = (first["run_at"] - first["updated_at"]).total_seconds()
+        assert 5 <= delay <= 10
+        assert await worker.claim() is None  # not due yet
+
+        await worker.run_job(await claim_due(storage, worker, job_id))
+        second = await storage.jobs.get(job_id)
+        assert second["status"] == "queued"
+        assert 10 <= (second["run_at"] - second["updated_at"]).total_seconds() <= 20
+
+        await worker.run_job(await claim_due(storage, worker, job_id))
+        return await storage.jobs.get(job_id)
+
+    done = asyncio.run(main())
+    assert done["status"] == "succeeded" and done["attempts"] == 3
+    assert done["result"] == {"calls": 3}
+    assert done["finished_at"] is not None
+
+
+def test_job_fails_permanently_after_max_attempts(flaky_handler):
+    flaky_handler["failures"] = 10
+    storage = create_storage("memory")
+    worker = jobs.JobWorker(storage)
+
+    async def main():
+        job_id = await jobs.enqueue(storage, "flaky", {}, max_attempts=2)
+        await worker.run_job(await worker.claim())
+        await worker.run_job(await claim_due(storage, worker, job_id))
+        assert await claim_due(storage, worker, job_id) is None
+        return await storage.jobs.get(job_id)
+
+    failed = asyncio.run(main())
+    assert failed["status"] == "failed" and failed["attempts"] == 2
+    assert failed["last_error"] == "failure 2"
+    assert failed["finished_at"] is not None
+
+
+def test_heartbeat_survives_a_failed_lock_extension(monkeypatch):
+    storage = create_storage("memory")
+    worker = jobs.JobWorker(storage, visibility_timeout=0.02)
+    extend_lock = storage.jobs.extend_lock
+    calls = []
+
+    async def flaky_extend_lock(job, visibility_timeout):
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionError("database unavailable")
+        await extend_lock(job, visibility_timeout)
+
+    storage.jobs.extend_lock = flaky_extend_lock
+
+    async def slow(storage, payload):
+        await asyncio.sleep(0.1)
+
+    monkeypatch.setitem(jobs.HANDLERS, "slow", slow)
+
+    async def main():
+        await jobs.enqueue(storage, "slow", {})
+        await worker.run_job(await worker.claim())
+
+    asyncio.run(main())
+    assert len(calls) > 2
+
+
+def test_finished_jobs_expire_after_retention():
+    storage = create_storage("memory")
+    now = datetime.now(timezone.utc)
+    old = now - timedelta(days=jobs.JOB_RETENTION_DAYS + 1)
+
+    async def main():
+        await jobs.enqueue(storage, "catch_logged", {"user_id": "u1"})
+        finished = jobs._new_job("catch_logged", {})
+        finished.update(status="succeeded", finished_at=old)
+        stale_queued = jobs._new_job("catch_logged", {})
+        stale_queued.update(created_at=old, updated_at=old)
+        await storage.jobs.insert_many([finished, stale_queued])
+        await storage.jobs.insert_many([])
+        return finished["id"], stale_queued["id"]
+
+    finished_id, queued_id = asyncio.run(main())
+    assert asyncio.run(storage.jobs.get(finished_id)) is None
+    assert asyncio.run(storage.jobs.get(queued_id)) is not None
+    assert asyncio.run(storage.jobs.count_by_status()) == {"queued": 2}
+
+
+def test_catch_logged_event_keeps_the_client_device():
+    storage = create_storage("memory")
+    iphone = "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) Mobile/15E148"
+    payload = {"catch_id": "c1", "user_id": "u1", "user_agent": iphone, "device_type": "mobile"}
+
+    asyncio.run(jobs.HANDLERS["catch_logged"](storage, payload))
+    event, = storage.analytics.events
+    assert event["meta"] == {"event_type": "catch_logged", "device_type": "mobile"}
+    assert event["user_agent"] == iphone and event["visitor_id"] == "u1"
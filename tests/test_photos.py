@@ -0,0 +1,113 @@
+import asyncio
+import io
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+from fastapi import HTTPException, Request
+from PIL import Image
+
+import photos
+
+
+@pytest.fixture(autouse=True)
+def photo_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(photos, "PHOTO_STORAGE_DIR", tmp_path)
+    yield tmp_path
+    photos.shutdown()
+
+
+def write_png(path, size):
+    buf = io.BytesIO()
+    Image.new("RGB", size, "green").save(buf, "PNG")
+    path.write_bytes(buf.getvalue())
+    return path
+
+
+def test_sniff_image_type():
+    assert photos.sniff_image_type(b"\xff\xd8\xff\xe0" + b"\x00" * 8) == "jpeg"
+    assert photos.sniff_image_type(b"\x89PNG\r\n\x1a\n\x00\x00\x00\r") == "png"
+    assert photos.sniff_image_type(b"RIFF\x00\x00\x00\x00WEBP") == "webp"
+    assert photos.sniff_image_type(b"<html><body>") is None
+
+
+def chunked_request(chunks):
+    """Multipart request streamed without a Content-Length, as with chunked encoding"""
+    scope = {"type": "http", "method": "POST", "path": "/",
+             "headers": [(b"content-type", b"multipart/form-data; boundary=xyz")]}
+    pending = list(chunks)
+
+    async def receive():
+        body = pending.pop(0) if pending else b""
+        return {"type": "http.request", "body": body, "more_body": bool(pending)}
+
+    return Request(scope, receive)
+
+
+def part(name, data):
+    return (b"--xyz\r\nContent-Disposition: form-data; name=\"" + name.encode()
+            + b"\"; filename=\"f\"\r\n\r\n" + data + b"\r\n")
+
+
+def test_receive_upload_streams_the_file_part(photo_dir):
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+    request = chunked_request([part("file", png)[:50], part("file", png)[50:] + b"--xyz--\r\n"])
+
+    path = asyncio.run(photos.receive_upload(request, max_bytes=1000))
+    assert path.read_bytes() == png
+
+
+def test_receive_upload_limits_the_whole_body(photo_dir):
+    png = b"\x89PNG\r\n\x1a\n" + b"\x00" * 100
+    # Small file part, then unbounded data in another part
+    chunks = [part("file", png)] + [b"--xyz\r\nContent-Disposition: form-data; name=\"other\"\r\n\r\n"]
+    chunks += [b"x" * 64 * 1024] * 10
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(photos.receive_upload(chunked_request(chunks), max_bytes=1000))
+    assert exc.value.status_code == 413
+    assert list((photo_dir / "incoming").iterdir()) == []
+
+
+def test_store_photo_writes_display_and_thumbnail(photo_dir):
+    upload = write_png(photo_dir / "upload", (2400, 1200))
+    urls = asyncio.run(photos.store_photo(upload))
+
+    with Image.open(photos.photo_path(urls["photo_url"].rsplit("/", 1)[1])) as display:
+        assert display.size == (photos.PHOTO_DISPLAY_MAX_PX, photos.PHOTO_DISPLAY_MAX_PX // 2)
+    with Image.open(photos.photo_path(urls["thumbnail_url"].rsplit("/", 1)[1])) as thumb:
+        assert max(thumb.size) == photos.PHOTO_THUMB_MAX_PX
+    assert not upload.exists()
+
+
+def test_oversized_image_is_refused_before_decoding(photo_dir, monkeypatch):
+    monkeypatch.setattr(photos, "PHOTO_MAX_PIXELS", 1000)
+    upload = write_png(photo_dir / "upload", (100, 100))
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(photos.store_photo(upload))
+    assert exc.value.status_code == 422
+    assert [p.name for p in photo_dir.iterdir()] == []
+
+
+def test_broken_pool_is_replaced_and_reported_as_unavailable(photo_dir, monkeypatch):
+    class BrokenPool:
+        def submit(self, *args, **kwargs):
+            future = Future()
+            future.set_exception(BrokenProcessPool("worker died"))
+            return future
+
+        def shutdown(self, **kwargs):
+            pass
+
+    monkeypatch.setattr(photos, "_pool", BrokenPool())
+    upload = write_png(photo_dir / "upload", (10, 10))
+
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(photos.store_photo(upload))
+    assert exc.value.status_code == 503
+    assert photos._pool is None
+
+    # The next upload gets a working pool
+    urls = asyncio.run(photos.store_photo(write_png(photo_dir / "upload", (10, 10))))
+    assert photos.photo_path(urls["thumbnail_url"].rsplit("/", 1)[1]).is_file()
@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from ratelimit import AdmissionController, RateLimiter, parse_limit
+
+
+def test_parse_limit():
+    assert parse_limit("10/minute") == (10 / 60, 10)
+    assert parse_limit("5/second") == (5, 5)
+
+
+def test_bucket_allows_burst_then_rejects_until_refilled(clock):
+    limiter = RateLimiter("test", "3/minute", clock=clock)
+
+    for _ in range(3):
+        limiter.hit("1.2.3.4")
+    with pytest.raises(HTTPException) as exc:
+        limiter.hit("1.2.3.4")
+    assert exc.value.status_code == 429
+    assert exc.value.headers["Retry-After"] == "20"
+    assert limiter.rejected == 1
+
+    # Other keys have their own bucket
+    limiter.hit("5.6.7.8")
+
+    clock.now = 20
+    limiter.hit("1.2.3.4")
+    with pytest.raises(HTTPException):
+        limiter.hit("1.2.3.4")
+
+
+def test_refund_returns_a_reserved_token(clock):
+    limiter = RateLimiter("test", "2/minute", clock=clock)
+
+    # Allowed attempts give their token back and never use up the bucket
+    for _ in range(5):
+        limiter.hit("k")
+        limiter.refund("k")
+    limiter.hit("k")
+    limiter.hit("k")
+    with pytest.raises(HTTPException):
+        limiter.hit("k")
+
+    # Refunds never push a bucket past its capacity
+    limiter.refund("fresh")
+    for _ in range(3):
+        limiter.refund("k")
+    assert limiter.buckets["k"].tokens == 2
+
+
+def test_tracked_keys_are_bounded(clock):
+    limiter = RateLimiter("test", "1/minute", max_keys=2, clock=clock)
+    for key in ("a", "b", "c"):
+        limiter.hit(key)
+    assert list(limiter.buckets) == ["b", "c"]
+    # The evicted key starts again with a full bucket
+    limiter.hit("a")
+
+
+def test_admission_sheds_only_when_overloaded():
+    admission = AdmissionController(max_in_flight=2, max_lag_ms=100)
+
+    async def main():
+        await admission.shed_low_priority()
+
+        admission.in_flight = 3
+        with pytest.raises(HTTPException) as exc:
+            await admission.shed_low_priority()
+        assert exc.value.status_code == 503
+
+        admission.in_flight = 0
+        admission.lag_ms = 150
+        with pytest.raises(HTTPException):
+            await admission.shed_low_priority()
+
+        admission.lag_ms = 10
+        await admission.shed_low_priority()
+
+    asyncio.run(main())
+    assert admission.shed == 2
+
+
+def test_admission_middleware_counts_in_flight_requests():
+    admission = AdmissionController(max_in_flight=1)
+    seen = []
+
+    async def call_next(request):
+        seen.append(admission.in_flight)
+        await asyncio.sleep(0.01)
+        return "response"
+
+    async def main():
+        return await asyncio.gather(*(admission.middleware(None, call_next) for _ in range(3)))
+
+    assert asyncio.run(main()) == ["response"] * 3
+    assert max(seen) == 3 and admission.overloaded is False and admission.in_flight == 0
+
+
+def test_event_loop_lag_is_measured():
+    admission = AdmissionController(max_lag_ms=20)
+
+    async def main():
+        monitor = asyncio.create_task(admission.monitor_event_loop_lag(interval=0.01))
+        await asyncio.sleep(0.02)
+        for _ in range(3):
+            # Block the loop, as a CPU-heavy handler would
+            time.sleep(0.1)
+            await asyncio.sleep(0.02)
+        monitor.cancel()
+
+    asyncio.run(main())
+    assert admission.overloaded
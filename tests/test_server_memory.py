@@ -0,0 +1,114 @@
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # No MongoDB needed: the lifespan creates the storage named by STORAGE_BACKEND
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    import server
+
+    with TestClient(server.app) as client:
+        yield client
+
+
+def register_and_login(client):
+    # Unique emails keep the module-level login limiters from carrying over between tests
+    email = f"angler-{uuid.uuid4().hex[:8]}@example.com"
+    response = client.post("/api/auth/register", json={"email": email, "password": "secret", "name": "Angler"})
+    assert response.status_code == 201
+
+    response = client.post("/api/auth/login", data={"username": email, "password": "secret"})
+    assert response.status_code == 200
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+def test_register_login_and_me(client):
+    headers = register_and_login(client)
+
+    response = client.get("/api/auth/me", headers=headers)
+    assert response.status_code == 200
+    assert response.json()["profile"]["name"] == "Angler"
+
+    assert client.get("/api/auth/me").status_code == 401
+
+
+def test_wrong_password_is_rejected(client):
+    email = f"angler-{uuid.uuid4().hex[:8]}@example.com"
+    client.post("/api/auth/register", json={"email": email, "password": "secret"})
+
+    response = client.post("/api/auth/login", data={"username": email, "password": "wrong"})
+    assert response.status_code == 401
+
+
+def test_catches_and_stats(client):
+    headers = register_and_login(client)
+    catches = [
+        {"fish_name": "Common", "weight": 10.5, "caught_at": "2024-05-04T06:00:00+00:00"},
+        {"fish_name": "Mirror", "weight": 15.0, "caught_at": "2024-05-20T07:30:00+00:00"},
+        {"fish_name": "Grass", "weight": 8.0, "caught_at": "2023-09-01T18:00:00+00:00"},
+    ]
+    created = []
+    for catch in catches:
+        response = client.post("/api/catches", json=catch, headers=headers)
+        assert response.status_code == 201
+        created.append(response.json())
+
+    response = client.get("/api/catches", headers=headers)
+    assert [c["fish_name"] for c in response.json()] == ["Mirror", "Common", "Grass"]
+    response = client.get("/api/catches", params={"year": 2024, "month": 5}, headers=headers)
+    assert len(response.json()) == 2
+
+    monthly = client.get("/api/stats/monthly", params={"year": 2024}, headers=headers).json()
+    may = next(m for m in monthly if m["month"] == 5)
+    assert may["total_count"] == 2
+    assert may["total_weight"] == 25.5
+    assert may["biggest_catch"]["fish_name"] == "Mirror"
+
+    yearly = client.get("/api/stats/yearly", headers=headers).json()
+    assert [(y["year"], y["total_count"]) for y in yearly] == [(2024, 2), (2023, 1)]
+
+    # Deleting a catch invalidates the cached stats
+    assert client.delete(f"/api/catches/{created[1]['id']}", headers=headers).status_code == 200
+    yearly = client.get("/api/stats/yearly", headers=headers).json()
+    assert yearly[0]["total_count"] == 1
+    assert yearly[0]["biggest_catch"]["fish_name"] == "Common"
+
+
+def test_catch_batch_is_safe_to_retry(client):
+    headers = register_and_login(client)
+    batch = [
+        {"idempotency_key": "a", "fish_name": "Common", "weight": 9.0},
+        {"idempotency_key": "b", "fish_name": "Mirror", "weight": 12.0},
+    ]
+
+    first = client.post("/api/catches/batch", json=batch, headers=headers).json()
+    assert (first["created"], first["duplicates"]) == (2, 0)
+
+    retry = client.post("/api/catches/batch", json=batch, headers=headers).json()
+    assert (retry["created"], retry["duplicates"]) == (0, 2)
+    assert [r["catch"]["id"] for r in retry["results"]] == [r["catch"]["id"] for r in first["results"]]
+    assert len(client.get("/api/catches", headers=headers).json()) == 2
+
+
+def test_catches_are_private_to_their_owner(client):
+    owner = register_and_login(client)
+    other = register_and_login(client)
+    catch = client.post("/api/catches", json={"fish_name": "Common"}, headers=owner).json()
+
+    assert client.get("/api/catches", headers=other).json() == []
+    assert client.delete(f"/api/catches/{catch['id']}", headers=other).status_code == 404
+
+
+def test_benchmark_runs_on_the_memory_backend(monkeypatch):
+    # Set here so monkeypatch restores what run() would otherwise leave in os.environ
+    monkeypatch.setenv("STORAGE_BACKEND", "memory")
+    monkeypatch.setenv("RUN_JOB_WORKER", "false")
+    monkeypatch.setenv("STATS_CACHE_TTL_SECONDS", "0")
+    import benchmark
+
+    timings = benchmark.run(catches=150, requests=2)
+    assert set(timings) == {name for name, _, _ in benchmark.ENDPOINTS}
+    assert all(len(samples) == 2 for samples in timings.values())
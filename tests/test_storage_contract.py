@@ -0,0 +1,266 @@
+"""Contract tests every storage backend must pass.
+
+The in-memory backend always runs. The Mongo backend runs when MONGO_URL is
+set, against a throwaway database that is dropped afterwards.
+"""
+import asyncio
+import os
+import uuid
+from datetime import datetime, timezone, timedelta
+
+import pytest
+
+import analytics_store
+from storage import DUPLICATE, create_storage
+
+BACKENDS = ["memory", "mongo"]
+
+
+def run_contract(backend, body):
+    """Run `body(storage)` against a fresh storage inside one event loop"""
+    if backend == "mongo" and not os.environ.get("MONGO_URL"):
+        pytest.skip("MONGO_URL not set")
+
+    async def main():
+        if backend == "mongo":
+            from storage_mongo import MongoStorage
+            storage = MongoStorage(os.environ["MONGO_URL"], f"carplog_contract_{uuid.uuid4().hex[:12]}")
+        else:
+            storage = create_storage(backend)
+        await storage.init()
+        try:
+            await body(storage)
+        finally:
+            if backend == "mongo":
+                await storage.client.drop_database(storage.db.name)
+            await storage.close()
+
+    asyncio.run(main())
+
+
+def make_catch(user_id, caught_at, **fields):
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": user_id,
+        "weight": 10.0,
+        "caught_at": caught_at.isoformat(),
+        "environment": None,
+        **fields,
+    }
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_users_create_lookup_and_update(backend):
+    async def body(storage):
+        user = {"id": "u1", "email": "a@example.com", "hashed_password": "x",
+                "profile": {"name": "A"}, "created_at": datetime.now(timezone.utc).isoformat()}
+        await storage.users.create(user)
+
+        assert (await storage.users.get_by_id("u1"))["email"] == "a@example.com"
+        assert (await storage.users.get_by_email("a@example.com"))["id"] == "u1"
+        assert await storage.users.get_by_email("missing@example.com") is None
+
+        updated = await storage.users.update_profile("u1", {"name": "B", "bio": "carp"})
+        assert updated["profile"] == {"name": "B", "bio": "carp"}
+        assert "_id" not in updated
+        assert (await storage.users.get_by_id("u1"))["profile"]["name"] == "B"
+
+    run_contract(backend, body)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_catches_list_filters_sorts_and_limits(backend):
+    async def body(storage):
+        base = datetime(2024, 5, 1, tzinfo=timezone.utc)
+        for day in (0, 10, 40):
+            await storage.catches.insert(make_catch("u1", base + timedelta(days=day)))
+        await storage.catches.insert(make_catch("u2", base))
+
+        everything = await storage.catches.list_for_user("u1")
+        assert len(everything) == 3
+        assert all("_id" not in c for c in everything)
+
+        may = await storage.catches.list_for_user(
+            "u1", datetime(2024, 5, 1, tzinfo=timezone.utc), datetime(2024, 6, 1, tzinfo=timezone.utc)
+        )
+        assert len(may) == 2
+
+        newest = await storage.catches.list_for_user("u1", limit=2, newest_first=True)
+        assert [c["caught_at"] for c in newest] == [
+            (base + timedelta(days=40)).isoformat(), (base + timedelta(days=10)).isoformat()
+        ]
+
+    run_contract(backend, body)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_catches_get_and_delete_are_scoped_to_owner(backend):
+    async def body(storage):
+        catch = make_catch("u1", datetime.now(timezone.utc))
+        await storage.catches.insert(catch)
+
+        assert await storage.catches.get("u2", catch["id"]) is None
+        assert (await storage.catches.get("u1", catch["id"]))["weight"] == 10.0
+
+        assert await storage.catches.delete("u2", catch["id"]) is None
+        deleted = await storage.catches.delete("u1", catch["id"])
+        assert deleted["id"] == catch["id"] and "_id" not in deleted
+        assert await storage.catches.delete("u1", catch["id"]) is None
+        assert await storage.catches.list_for_user("u1") == []
+
+    run_contract(backend, body)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_catches_set_photo(backend):
+    async def body(storage):
+        catch = make_catch("u1", datetime.now(timezone.utc), photo_base64="data:image/png;base64,AAAA")
+        await storage.catches.insert(catch)
+        fields = {"photo_url": "/api/photos/a_display.jpg", "thumbnail_url": "/api/photos/a_thumb.jpg",
+                  "photo_base64": None}
+
+        assert await storage.catches.set_photo("u2", catch["id"], fields) is None
+        updated = await storage.catches.set_photo("u1", catch["id"], fields)
+        assert updated["photo_url"] == "/api/photos/a_display.jpg" and updated["photo_base64"] is None
+        assert (await storage.catches.get("u1", catch["id"]))["thumbnail_url"] == "/api/photos/a_thumb.jpg"
+
+    run_contract(backend, body)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_catches_insert_many_dedupes_idempotency_keys(backend):
+    async def body(storage):
+        now = datetime.now(timezone.utc)
+        first = [make_catch("u1", now, idempotency_key="k1"), make_catch("u1", now, idempotency_key="k2")]
+        assert await storage.catches.insert_many(first) == {}
+
+        retry = [
+            make_catch("u1", now, idempotency_key="k1"),
+            make_catch("u1", now, idempotency_key="k3"),
+            make_catch("u1", now, idempotency_key="k3"),
+            make_catch("u2", now, idempotency_key="k1"),  # keys are per user
+        ]
+        assert await storage.catches.insert_many(retry) == {0: DUPLICATE, 2: DUPLICATE}
+
+        stored = await storage.catches.find_by_idempotency_keys("u1", ["k1", "k3", "unknown"])
+        assert {c["idempotency_key"]: c["id"] for c in stored} == {"k1": first[0]["id"], "k3": retry[1]["id"]}
+        assert len(await storage.catches.list_for_user("u1")) == 3
+
+    run_contract(backend, body)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_catches_environment_backfill_round_trip(backend):
+    async def body(storage):
+        now = datetime.now(timezone.utc)
+        missing = make_catch("u1", now, latitude=51.5, longitude=-0.1)
+        enriched = make_catch("u1", now, environment={"moon_phase": "Full Moon"})
+        await storage.catches.insert(missing)
+        await storage.catches.insert(enriched)
+
+        todo = await storage.catches.list_missing_environment("u1")
+        assert [(c["id"], c["latitude"]) for c in todo] == [(missing["id"], 51.5)]
+
+        assert await storage.catches.set_environments({missing["id"]: {"moon_phase": "New Moon"}}) == 1
+        assert await storage.catches.list_missing_environment("u1") == []
+        phases = sorted(c["environment"]["moon_phase"] for c in await storage.catches.list_with_environment("u1"))
+        assert phases == ["Full Moon", "New Moon"]
+
+    run_contract(backend, body)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_analytics_totals_survive_compaction(backend):
+    async def body(storage):
+        today = datetime.now(timezone.utc).replace(hour=12, minute=0, second=0, microsecond=0)
+        for days_ago, event_type in ((2, "visit"), (2, "visit"), (1, "install"), (0, "visit")):
+            await storage.analytics.record(analytics_store.build_event(
+                event_type, None, "mobile", None, str(uuid.uuid4()), today - timedelta(days=days_ago)
+            ))
+
+        def totals(summaries):
+            counts = {}
+            for summary in summaries:
+                for row in summary["counts"]:
+                    counts[row["event_type"]] = counts.get(row["event_type"], 0) + row["count"]
+            return counts
+
+        before = totals(await storage.analytics.daily_summaries())
+        assert await storage.analytics.compact() == 2
+        assert await storage.analytics.compact() == 0
+        summaries = await storage.analytics.daily_summaries()
+
+        assert totals(summaries) == before == {"visit": 3, "install": 1}
+        by_day = {s["day"]: s for s in summaries}
+        assert by_day[(today - timedelta(days=2)).date().isoformat()]["unique_visitors"] == 2
+
+    run_contract(backend, body)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_analytics_unique_visitors_are_distinct_across_days(backend):
+    async def body(storage):
+        today = datetime.now(timezone.utc).replace(hour=12, minute=0, second=0, microsecond=0)
+        # One angler logging catches on three days, plus one other visitor
+        for days_ago, visitor_id in ((2, "angler"), (1, "angler"), (1, "other"), (0, "angler")):
+            await storage.analytics.record(analytics_store.build_event(
+                "catch_logged", None, None, None, visitor_id, today - timedelta(days=days_ago)
+            ))
+
+        assert await storage.analytics.count_unique_visitors() == 2
+        await storage.analytics.compact()
+        assert await storage.analytics.count_unique_visitors() == 2
+        # Per-day counts stay per day
+        by_day = {s["day"]: s["unique_visitors"] for s in await storage.analytics.daily_summaries()}
+        assert by_day[(today - timedelta(days=1)).date().isoformat()] == 2
+
+    run_contract(backend, body)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_jobs_claim_lock_and_finish(backend):
+    async def body(storage):
+        now = datetime.now(timezone.utc)
+        job = {
+            "id": "j1", "type": "noop", "payload": {}, "user_id": "u1", "status": "queued",
+            "attempts": 0, "max_attempts": 3, "run_at": now - timedelta(seconds=1),
+            "locked_until": None, "lock_token": None, "last_error": None, "result": None,
+            "created_at": now, "updated_at": now,
+        }
+        await storage.jobs.insert_many([job])
+
+        assert await storage.jobs.claim(["other"], "w1", 60) is None
+        claimed = await storage.jobs.claim(["noop"], "w1", 60)
+        assert claimed["status"] == "running" and claimed["attempts"] == 1
+        # Locked: nobody else can take it
+        assert await storage.jobs.claim(["noop"], "w2", 60) is None
+
+        # A stale holder cannot record an outcome
+        await storage.jobs.finish({**claimed, "lock_token": "stale"}, {"status": "failed"})
+        assert (await storage.jobs.get("j1"))["status"] == "running"
+
+        await storage.jobs.finish(claimed, {"status": "succeeded", "result": {"ok": True}})
+        stored = await storage.jobs.get("j1")
+        assert stored["status"] == "succeeded" and stored["result"] == {"ok": True}
+        assert "lock_token" not in stored
+        assert await storage.jobs.count_by_status() == {"succeeded": 1}
+
+    run_contract(backend, body)
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_jobs_expired_lock_can_be_reclaimed(backend):
+    async def body(storage):
+        now = datetime.now(timezone.utc)
+        await storage.jobs.insert_many([{
+            "id": "j1", "type": "noop", "payload": {}, "user_id": None, "status": "queued",
+            "attempts": 0, "max_attempts": 3, "run_at": now, "locked_until": None,
+            "lock_token": None, "last_error": None, "result": None, "created_at": now, "updated_at": now,
+        }])
+        first = await storage.jobs.claim(["noop"], "w1", 0)
+        await asyncio.sleep(0.01)
+        second = await storage.jobs.claim(["noop"], "w2", 60)
+        assert second is not None and second["attempts"] == 2
+        assert second["lock_token"] != first["lock_token"]
+
+    run_contract(backend, body)